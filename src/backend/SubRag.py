@@ -1,91 +1,192 @@
-from typing import List
-import psycopg2, os
+from typing import AsyncIterator, List, Optional
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.retrievers import BaseRetriever
 from langchain_core.documents import Document
-from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.callbacks import (BaseCallbackHandler, CallbackManagerForRetrieverRun,
+                                      AsyncCallbackManagerForRetrieverRun)
+from langchain_core.runnables import RunnableGenerator, RunnableLambda
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_community.chat_message_histories import ChatMessageHistory
 
 from .config import *
 from .dataSchemas import Response
+from .metrics import RequestStats, process_rss_bytes, DISTANCE_BUCKETS, TOKEN_BUCKETS
+from .session_store import make_session_store
+from .query_rewrite import needs_rephrase
 from .data_prep import initiate_data_prep, get_embeddings
-from .setup_db import get_db_string, setup_db
+from .setup_db import setup_db
+from .db_pool import DBPool
+from .embedding_cache import QueryEmbeddingCache
+from .embedding_batcher import EmbeddingBatcher
+from .answer_cache import SemanticAnswerCache
+from .vector_store import PostgresVectorStore, VectorStore, make_vector_store
+from .reranker import CrossEncoderReranker
+from .context_budget import assemble_context
+from .llm_resilience import CircuitBreaker, LLMUnavailable, ResilientChatModel
 
 
 class SubRag():
-    def __init__(self):
-
+    def __init__(self, llm=None, vector_store: Optional[VectorStore] = None):
+        """
+        `llm` replaces the model selected by LLM_BACKEND (e.g. a FakeChatModel in benchmarks).
+        `vector_store` replaces the one selected by VECTOR_BACKEND and runs without PostgreSQL:
+        no answer cache, in-memory history, and the movies are the ones in the store.
+        """
         load_dotenv()
-        if not os.environ.get("GEMINI_API_KEY"):
+        if llm is None and LLM_BACKEND == "gemini" and not os.environ.get("GEMINI_API_KEY"):
             raise Exception("❌ Error not API key found")
         
-        self.history_store = {} # Stores history in memory
-        self.embeddings = get_embeddings()
-        self.llm = self._initialize_llm()
-        self.db_connection = self._setup_db_connnection()
-        self.movies = self._load_movies()
-        self.rag_pipeline = self.load_rag_chain()
+        # Wall-clock time of each startup phase, logged and reported by /api/status
+        self.startup_timings = {}
+        with self._startup_phase("embedding_model"):
+            self.embeddings = get_embeddings(HF_EMBEDDING_MODEL, DEVICE)
+            # Concurrent cache misses are embedded together in one forward pass
+            self.embed_batcher = EmbeddingBatcher(self.embeddings) if EMBED_BATCHING_ENABLED else None
+            self.query_embeddings = QueryEmbeddingCache(self.embed_batcher or self.embeddings, HF_EMBEDDING_MODEL)
+        # CPU-bound embedding runs here so it never blocks the event loop
+        self.embed_executor = ThreadPoolExecutor(max_workers=EMBED_EXECUTOR_WORKERS, thread_name_prefix="embed")
+        with self._startup_phase("llm"):
+            self.llm_breaker = CircuitBreaker()
+            self.llm = llm if llm is not None else self._initialize_llm()
+        with self._startup_phase("database"):
+            self.db_pool = self._setup_db_pool() if vector_store is None else None
+            use_answer_cache = ANSWER_CACHE_ENABLED and self.db_pool is not None
+            self.answer_cache = SemanticAnswerCache(self.db_pool) if use_answer_cache else None
+            self.history_store = make_session_store(HISTORY_BACKEND if self.db_pool else "memory", self.db_pool)
+        self.reranker = CrossEncoderReranker() if RERANK_ENABLED else None
+        with self._startup_phase("movies"):
+            self.movies = self._load_movies() if vector_store is None else vector_store.movies()
+        with self._startup_phase("vector_store"):
+            self.vector_store = vector_store or make_vector_store(VECTOR_BACKEND, self.db_pool)
+        with self._startup_phase("chain"):
+            self.rag_pipeline = self.load_rag_chain()
         self.number_of_retrieved_chunks = SEARCH_KWARGS['k']
 
+    @contextmanager
+    def _startup_phase(self, name: str):
+        start = time.perf_counter()
+        yield
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.startup_timings[name] = elapsed_ms
+        print(f"ℹ️ Startup phase '{name}' took {elapsed_ms:.0f} ms")
+
+    def warm_up(self):
+        """
+        Runs one embedding and one search (and loads the re-ranker), so the first real
+        query does not pay for lazy initialisation (model graph, index pages, pool connections).
+        """
+        with self._startup_phase("warm_up"):
+            # Straight to the model: a warm-up query has no business in the embedding cache
+            query_embedding = self.embeddings.embed_query("warm up")
+            self._search_chunks("warm up", query_embedding, k=1)
+            if self.reranker is not None:
+                self.reranker.rerank("warm up", [{"text": "warm up"}, {"text": "up"}], 1)
+
     def _initialize_llm(self):
-        print(f"Initializing Gemini LLM with model: {GEMINI_MODEL_NAME}")
-        llm = ChatGoogleGenerativeAI(
-            model=GEMINI_MODEL_NAME,
-            temperature=TEMPERATURE
-        )
-        return llm
+        if LLM_BACKEND == "fake":
+            from .fake_llm import FakeChatModel
+            print(f"⚠️ Using the offline fake LLM ({FAKE_LLM_LATENCY_MS} ms + {FAKE_LLM_TOKEN_MS} ms/word)")
+            llm = FakeChatModel()
+        elif LLM_BACKEND == "gemini":
+            # Imported here: the Google client libraries are slow to import
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            print(f"Initializing Gemini LLM with model: {GEMINI_MODEL_NAME}")
+            llm = ChatGoogleGenerativeAI(
+                model=GEMINI_MODEL_NAME,
+                temperature=TEMPERATURE,
+                timeout=LLM_TIMEOUT_S,
+                max_retries=1,  # A single attempt: ResilientChatModel does the retrying
+            )
+        else:
+            raise ValueError(f"❌ Unknown LLM_BACKEND: {LLM_BACKEND}")
+        return ResilientChatModel(inner=llm, breaker=self.llm_breaker)
     
-    def _setup_db_connnection(self):
+    def _setup_db_pool(self) -> DBPool:
         """
         Connects to PostgreSQL using pgvector.
-        This does NOT load vectors into memory. It creates a connection object.
+        This does NOT load vectors into memory. It creates a bounded connection pool
+        shared by all concurrent requests.
         """
         try:
             setup_db()
-            conn = psycopg2.connect(get_db_string())
-            return conn
+            return DBPool()
         except Exception as e:
             raise Exception(f"❌ Failed to connect to PGVector: {e}")
     
 
     def _load_movies(self) -> List[str]:
-        def fetch_query():
-            with self.db_connection.cursor() as cur:
-                cur.execute('SELECT DISTINCT movie_name FROM movie_chunks ORDER BY movie_name;')
-                return [row[0] for row in cur.fetchall()]
+        manifest = PostgresVectorStore(self.db_pool)
+        movies = manifest.movies()
 
-        movies = fetch_query()
-
-        if not movies:
-            initiate_data_prep()
-            movies = fetch_query()
+        if not movies and INGEST_ON_STARTUP:
+            initiate_data_prep(self.embeddings)
+            movies = manifest.movies()
+        elif not movies:
+            print("⚠️ No movies ingested yet. Run `python -m src.backend.ingest build` and `... ingest load`.")
         
         print("ℹ️ Subtitles for movies loaded:", ", ".join(movies))
         
         return movies
 
-    def _retrieve_relevant_chunks(self, my_query: str) -> List[dict]:
-        query_embedding = self.embeddings.embed_query(my_query)
-        with self.db_connection.cursor() as cur:
-            cur.execute(
-                """
-                SELECT content, embedding <-> %s::vector as distance
-                FROM movie_chunks
-                ORDER BY distance
-                LIMIT %s
-                """,
-                (query_embedding, self.number_of_retrieved_chunks),)
+    def resolve_movies(self, movies: Optional[List[str]]) -> Optional[List[str]]:
+        """Maps requested movie names (case-insensitive) to loaded ones; None means all movies."""
+        if not movies:
+            return None
+        known = {movie.lower(): movie for movie in self.movies}
+        unknown = [movie for movie in movies if movie.lower() not in known]
+        if unknown:
+            raise ValueError(f"Unknown movie(s): {', '.join(unknown)}")
+        return sorted({known[movie.lower()] for movie in movies})
+
+    def _search_chunks(self, my_query: str, query_embedding: List[float],
+                       movies: Optional[List[str]] = None, k: int = None) -> List[dict]:
+        k = k or self.number_of_retrieved_chunks
+        return self.vector_store.search(my_query, query_embedding, k, movies)
+
+    def _retrieve_relevant_chunks(self, my_query: str, query_embedding: List[float] = None,
+                                  movies: Optional[List[str]] = None, k: int = None,
+                                  stats: RequestStats = None) -> List[dict]:
+        stats = stats if stats is not None else RequestStats()
+        if query_embedding is None:
+            with stats.span("embed_query"):
+                query_embedding = self.query_embeddings.embed_query(my_query)
+        with stats.span("vector_search"):
+            return self._search_chunks(my_query, query_embedding, movies, k)
+
+    def _expand_context(self, results: List[dict]) -> List[dict]:
+        """Widens each hit to the neighbouring dialogue by time range (CONTEXT_EXPAND_SECONDS)."""
+        if CONTEXT_EXPAND_SECONDS <= 0:
+            return results
+        return self.vector_store.expand(results, CONTEXT_EXPAND_SECONDS)
 
-            results = [
-                {"text": row[0], "distance": row[1]}
-                for row in cur.fetchall()]
+    async def _aembed_query(self, my_query: str) -> List[float]:
+        if self.embed_batcher is not None:
+            # Memory-cache hits return at once (the SQLite tier is read and written in a thread);
+            # a miss awaits the shared batch without holding an executor thread, so all
+            # concurrent misses can join it
+            return await self.query_embeddings.aembed_query(my_query)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.embed_executor, self.query_embeddings.embed_query, my_query)
 
-        return results
+    async def _aretrieve_relevant_chunks(self, my_query: str, query_embedding: List[float] = None,
+                                         movies: Optional[List[str]] = None, k: int = None,
+                                         stats: RequestStats = None) -> List[dict]:
+        stats = stats if stats is not None else RequestStats()
+        if query_embedding is None:
+            with stats.span("embed_query"):
+                query_embedding = await self._aembed_query(my_query)
+        # psycopg2 (and a large numpy scan) is blocking, so the search runs in the default thread pool
+        loop = asyncio.get_running_loop()
+        with stats.span("vector_search"):
+            return await loop.run_in_executor(None, self._search_chunks, my_query, query_embedding, movies, k)
 
     def load_rag_chain(self):
         """Sets up the RAG logic using LCEL instead of a legacy chain."""
@@ -112,12 +213,13 @@ class SubRag():
         ])
         
         # This sub-chain creates the standalone query string
-        rephrase_chain = rephrase_prompt | llm | StrOutputParser()
+        rephrase_chain = rephrase_prompt | llm.with_config(tags=["rephrase"]) | StrOutputParser()
         
         # --- STEP 2: Define the Final RAG Prompt ---
         template = """
         You are a helpful assistant specialized in movie scripts.
         If the answer isn't in the context, say you don't know based on the script.
+        Each passage of the context starts with [movie start-end].
         Answer the question based ONLY on the following context:
         {final_context}
         """
@@ -126,68 +228,326 @@ class SubRag():
             ("human", "{rephrased_question}"),
         ])
 
-        retriever = PostgresRetriever(rag_instance=self)
+        retriever = PostgresRetriever(rag_instance=self, reranker=self.reranker)
 
         # --- STEP 3: The Combined Pipeline ---
-        def get_context_and_question(input_dict):
-            # We re-phrase the question first using history
-            standalone_question = rephrase_chain.invoke({
+        def rephrase_inputs(input_dict, stats: RequestStats):
+            """Returns the rephrase chain input, or None when the question can be used as is."""
+            if not needs_rephrase(input_dict["init_question"], input_dict["chat_history"], REPHRASE_MODE):
+                stats.inc("llm_calls_saved")
+                print(f"ℹ️: Question used as is (rephrase skipped): {input_dict['init_question']}")
+                return None
+            stats.inc("llm_calls")
+            return {
                 "chat_history": input_dict["chat_history"],
                 "initial_question": input_dict["init_question"]
-            })
-            print(f"ℹ️: Re-phrased question: {standalone_question}")
+            }
+
+        def get_context_and_question(input_dict):
+            stats = input_dict.get("request_stats") or RequestStats()
+            movies = input_dict.get("movies")
+            standalone_question = input_dict["init_question"]
+            # We re-phrase the question first using history (only when it is needed)
+            inputs = rephrase_inputs(input_dict, stats)
+            if inputs is not None:
+                standalone_question = rephrase_chain.invoke(inputs)
+                print(f"ℹ️: Re-phrased question: {standalone_question}")
+
+            query_embedding = None
+            if self.answer_cache is not None:
+                with stats.span("embed_query"):
+                    query_embedding = self.query_embeddings.embed_query(standalone_question)
+                with stats.span("answer_cache_lookup"):
+                    cached_answer = self.answer_cache.lookup(query_embedding, movies, stats)
+                if cached_answer is not None:
+                    return {"cached_answer": cached_answer, "request_stats": stats}
+
             # Then retrieve using the standalone version
+            documents = retriever.invoke(
+                standalone_question, query_embedding=query_embedding, movies=movies, stats=stats)
+            with stats.span("assemble_context"):
+                final_context = assemble_context(documents, stats=stats)
+            return {
+                "final_context": final_context,
+                "rephrased_question": standalone_question,
+                "query_embedding": query_embedding,
+                "movies": movies,
+                "request_stats": stats,
+            }
+
+        async def aget_context_and_question(input_dict):
+            stats = input_dict.get("request_stats") or RequestStats()
+            movies = input_dict.get("movies")
+            standalone_question = input_dict["init_question"]
+            inputs = rephrase_inputs(input_dict, stats)
+            if inputs is not None:
+                standalone_question = await rephrase_chain.ainvoke(inputs)
+                print(f"ℹ️: Re-phrased question: {standalone_question}")
+
+            query_embedding = None
+            if self.answer_cache is not None:
+                with stats.span("embed_query"):
+                    query_embedding = await self._aembed_query(standalone_question)
+                loop = asyncio.get_running_loop()
+                with stats.span("answer_cache_lookup"):
+                    cached_answer = await loop.run_in_executor(
+                        None, self.answer_cache.lookup, query_embedding, movies, stats)
+                if cached_answer is not None:
+                    return {"cached_answer": cached_answer, "request_stats": stats}
+
+            documents = await retriever.ainvoke(
+                standalone_question, query_embedding=query_embedding, movies=movies, stats=stats)
+            with stats.span("assemble_context"):
+                final_context = assemble_context(documents, stats=stats)
             return {
-                "final_context": retriever.invoke(standalone_question),
+                "final_context": final_context,
                 "rephrased_question": standalone_question,
+                "query_embedding": query_embedding,
+                "movies": movies,
+                "request_stats": stats,
             }
 
+        # The tags name the stage in LLMStageCallback's timings
+        answer_chain = qa_prompt | llm.with_config(tags=["generate"]) | StrOutputParser()
+
+        def store_answer(inputs):
+            """Passes the answer stream through and caches the full answer once it is complete."""
+            def save(parts):
+                self.answer_cache.store(
+                    inputs["rephrased_question"], inputs["query_embedding"], "".join(parts), inputs["movies"])
+
+            def transform(chunks):
+                parts = []
+                for chunk in chunks:
+                    parts.append(chunk)
+                    yield chunk
+                save(parts)
+
+            async def atransform(chunks):
+                parts = []
+                async for chunk in chunks:
+                    parts.append(chunk)
+                    yield chunk
+                await asyncio.get_running_loop().run_in_executor(None, save, parts)
+
+            return RunnableGenerator(transform, atransform)
+
+        def answer_or_cached(inputs):
+            # Returning a Runnable makes LCEL run (and stream) it with the same inputs
+            stats = inputs["request_stats"]
+            if "cached_answer" in inputs:
+                stats.inc("llm_calls_saved")
+                print("ℹ️: Answer served from the semantic cache")
+                return inputs["cached_answer"]
+            stats.inc("llm_calls")
+            if self.answer_cache is None:
+                return answer_chain
+            return answer_chain | store_answer(inputs)
+
         self.rag_pipeline = (
-            get_context_and_question 
-            | qa_prompt 
-            | llm 
-            | StrOutputParser()
+            RunnableLambda(get_context_and_question, afunc=aget_context_and_question)
+            | RunnableLambda(answer_or_cached)
         )
         return self.rag_pipeline
-    
-    def rag_response(self, query: str, session_id: str) -> Response:
-        with_history = RunnableWithMessageHistory(
+
+    def _with_history(self) -> RunnableWithMessageHistory:
+        return RunnableWithMessageHistory(
             self.rag_pipeline,
             self._get_session_history,
             input_messages_key="init_question",
             history_messages_key="chat_history",
         )
+    
+    @staticmethod
+    def _run_config(session_id: str, stats: RequestStats) -> dict:
+        # We pass a config object with the session_id; the callback times the LLM stages
+        return {"configurable": {"session_id": session_id}, "callbacks": [LLMStageCallback(stats)]}
+
+    def rag_response(self, query: str, session_id: str, movies: Optional[List[str]] = None,
+                     debug: bool = False) -> Response:
+        with_history = self._with_history()
+        stats = RequestStats()
         
         try:
-            # We pass a config object with the session_id
-            answer = with_history.invoke(
-                {"init_question": query},
-                config={"configurable": {"session_id": session_id}}
-            )
+            with stats.span("total"):
+                answer = with_history.invoke(
+                    {"init_question": query, "movies": movies, "request_stats": stats},
+                    config=self._run_config(session_id, stats)
+                )
+        except LLMUnavailable:
+            # Overload is the caller's to handle (the API answers 503 with Retry-After)
+            raise
         except Exception as e:
             answer = f"\n❌ ERROR during RAG execution: {e}\n"
         
-        return Response(query=query, answer=answer)
-    
+        return Response(query=query, answer=answer, stats=stats.as_dict(),
+                        timings=stats.timings_dict() if debug or DEBUG_TIMINGS else {})
+
+    async def arag_response(self, query: str, session_id: str,
+                            movies: Optional[List[str]] = None, debug: bool = False) -> Response:
+        """Async twin of `rag_response`: LLM calls are awaited and embedding/DB work is offloaded."""
+        with_history = self._with_history()
+        stats = RequestStats()
+
+        try:
+            with stats.span("total"):
+                answer = await with_history.ainvoke(
+                    {"init_question": query, "movies": movies, "request_stats": stats},
+                    config=self._run_config(session_id, stats)
+                )
+        except LLMUnavailable:
+            # Overload is the caller's to handle (the API answers 503 with Retry-After)
+            raise
+        except Exception as e:
+            answer = f"\n❌ ERROR during RAG execution: {e}\n"
+
+        return Response(query=query, answer=answer, stats=stats.as_dict(),
+                        timings=stats.timings_dict() if debug or DEBUG_TIMINGS else {})
+
+    async def astream_response(self, query: str, session_id: str, movies: Optional[List[str]] = None,
+                               stats: RequestStats = None) -> AsyncIterator[str]:
+        """Yields the answer token by token; the history is saved once the stream completes."""
+        with_history = self._with_history()
+        stats = stats if stats is not None else RequestStats()
+        with stats.span("total"):
+            async for chunk in with_history.astream(
+                {"init_question": query, "movies": movies, "request_stats": stats},
+                config=self._run_config(session_id, stats)
+            ):
+                yield chunk
+
+    def status_stats(self) -> dict:
+        """Point-in-time gauges of the components, reported by /api/status."""
+        stats = self.query_embeddings.stats()
+        stats.update(self.history_store.stats())
+        stats.update(self.vector_store.stats())
+        stats.update(self.llm_breaker.stats())
+        if self.embed_batcher is not None:
+            stats.update(self.embed_batcher.stats())
+        stats.update({f"startup_{name}_ms": ms for name, ms in self.startup_timings.items()})
+        stats["process_rss_bytes"] = process_rss_bytes()
+        if self.answer_cache is not None:
+            stats.update(self.answer_cache.stats())
+        if self.reranker is not None:
+            stats.update(self.reranker.stats())
+        return stats
+
+    def close(self):
+        """Releases the pooled DB connections, the embedding threads and the cache file."""
+        self.vector_store.close()
+        if self.db_pool is not None:
+            self.db_pool.close()
+        self.embed_executor.shutdown(wait=False)
+        if self.embed_batcher is not None:
+            self.embed_batcher.close()
+        self.query_embeddings.close()
+
     def _delete_history_with(self, session_id: str):
-        self.history_store.pop(session_id, None)
+        self.history_store.delete(session_id)
     
     def _get_session_history(self, session_id: str):
-        if session_id not in self.history_store:
-            self.history_store[session_id] = ChatMessageHistory()
-        return self.history_store[session_id]
+        return self.history_store.get(session_id)
     
 class PostgresRetriever(BaseRetriever):
+    # Searches rag_instance.vector_store (pgvector by default, or the in-process numpy store)
     rag_instance: any 
+    reranker: any = None  # Optional CrossEncoderReranker
+    k: int = SEARCH_KWARGS['k']
+    fetch_k: int = RERANK_CANDIDATES  # Candidates over-fetched for the re-ranker
+
+    @staticmethod
+    def _to_documents(results: List[dict]) -> List[Document]:
+        # Convert your dict results into LangChain Document objects, keeping where each chunk comes from
+        return [
+            Document(
+                page_content=r["text"],
+                metadata={key: r[key] for key in ("movie", "start_time", "end_time", "distance") if key in r},
+            )
+            for r in results]
+
+    @staticmethod
+    def _record_results(stats: RequestStats, results: List[dict]) -> None:
+        stats.inc("retrieved_chunks", len(results))
+        for r in results:
+            # Hybrid hits found only by full-text search have no vector distance
+            if r.get("distance") is not None:
+                stats.observe("retrieved_distance", r["distance"], DISTANCE_BUCKETS)
 
     def _get_relevant_documents(
-        self, query: str, *, run_manager: CallbackManagerForRetrieverRun = None
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun = None, **kwargs
     ) -> List[Document]:
+        stats = kwargs.setdefault("stats", RequestStats())
         # Reuse your existing manual SQL retrieval method
-        results = self.rag_instance._retrieve_relevant_chunks(query)
-        
-        # Convert your dict results into LangChain Document objects
-        return [Document(page_content=r["text"]) for r in results]
+        if self.reranker is None:
+            results = self.rag_instance._retrieve_relevant_chunks(query, k=self.k, **kwargs)
+        else:
+            candidates = self.rag_instance._retrieve_relevant_chunks(query, k=self.fetch_k, **kwargs)
+            with stats.span("rerank"):
+                results = self.reranker.rerank(query, candidates, self.k)
+        self._record_results(stats, results)
+        if CONTEXT_EXPAND_SECONDS > 0:
+            with stats.span("expand_context"):
+                results = self.rag_instance._expand_context(results)
+        return self._to_documents(results)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun = None, **kwargs
+    ) -> List[Document]:
+        stats = kwargs.setdefault("stats", RequestStats())
+        if self.reranker is None:
+            results = await self.rag_instance._aretrieve_relevant_chunks(query, k=self.k, **kwargs)
+        else:
+            candidates = await self.rag_instance._aretrieve_relevant_chunks(query, k=self.fetch_k, **kwargs)
+            # Cross-encoder scoring is CPU-bound, like embedding
+            loop = asyncio.get_running_loop()
+            with stats.span("rerank"):
+                results = await loop.run_in_executor(
+                    self.rag_instance.embed_executor, self.reranker.rerank, query, candidates, self.k)
+        self._record_results(stats, results)
+        if CONTEXT_EXPAND_SECONDS > 0:
+            with stats.span("expand_context"):
+                results = await asyncio.get_running_loop().run_in_executor(
+                    None, self.rag_instance._expand_context, results)
+        return self._to_documents(results)
+
+
+class LLMStageCallback(BaseCallbackHandler):
+    """
+    Times each LLM call of a request (stage = its "rephrase"/"generate" tag), including the
+    time to the first streamed token, and counts prompt/completion tokens from usage metadata.
+    """
+    run_inline = True  # Called in the caller's thread/loop, so timestamps are not delayed
+
+    def __init__(self, stats: RequestStats):
+        self.stats = stats
+        self._runs = {}  # run_id -> (stage, start, first token seen)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, **kwargs):
+        stage = next((tag for tag in (tags or []) if tag in ("rephrase", "generate")), "llm")
+        self._runs[run_id] = [stage, time.perf_counter(), False]
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run is not None and not run[2]:
+            run[2] = True
+            self.stats.record(f"{run[0]}_first_token", (time.perf_counter() - run[1]) * 1000)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        self.stats.record(run[0], (time.perf_counter() - run[1]) * 1000)
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    self.stats.inc("prompt_tokens", usage.get("input_tokens", 0))
+                    self.stats.inc("completion_tokens", usage.get("output_tokens", 0))
+                    self.stats.observe("llm_prompt_tokens", usage.get("input_tokens", 0), TOKEN_BUCKETS)
+                    self.stats.observe("llm_completion_tokens", usage.get("output_tokens", 0), TOKEN_BUCKETS)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._runs.pop(run_id, None)
 
 if __name__ == '__main__':
     
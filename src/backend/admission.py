@@ -0,0 +1,134 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, defaultdict, deque
+
+from .config import *
+from .metrics import metrics
+
+
+class AdmissionRejected(Exception):
+    """The query was not admitted; the API answers 429 with `retry_after` seconds."""
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionTicket():
+    """A granted slot; `release` is idempotent, so it can be called from several cleanup paths."""
+    def __init__(self, controller: "AdmissionController", session_id: str):
+        self.controller = controller
+        self.session_id = session_id
+        self.started = time.perf_counter()
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class AdmissionController():
+    """
+    Bounds the queries processed at once (`max_in_flight`). Others wait for a slot, at most
+    `max_queue` of them and for at most `max_wait` seconds; a session may have at most
+    `max_per_session` queries in flight or waiting. Freed slots go to the waiting sessions
+    round-robin, so one busy session cannot starve the rest. Anything over a limit is
+    rejected with a Retry-After estimated from the recent service time.
+    Lives on the event loop (no locks).
+    """
+    def __init__(self, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 max_wait: float = ADMISSION_MAX_WAIT_S, max_per_session: int = ADMISSION_MAX_PER_SESSION):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_per_session = max_per_session
+        self.in_flight = 0
+        self.queued = 0
+        self._waiters = OrderedDict()  # session_id -> deque of Futures, in round-robin order
+        self._per_session = defaultdict(int)  # session_id -> queries in flight or waiting
+        self._service_s = 1.0  # moving average of the time a query holds its slot
+
+    def retry_after(self) -> int:
+        # Time for the queue ahead (plus this query) to drain through the slots
+        return max(1, math.ceil(self._service_s * (self.queued + 1) / self.max_in_flight))
+
+    def _reject(self, reason: str) -> None:
+        metrics.inc(f"admission_rejected_{reason}")
+        raise AdmissionRejected(reason, self.retry_after())
+
+    def _forget(self, session_id: str) -> None:
+        self._per_session[session_id] -= 1
+        if self._per_session[session_id] <= 0:
+            del self._per_session[session_id]
+
+    async def acquire(self, session_id: str) -> AdmissionTicket:
+        if self._per_session.get(session_id, 0) >= self.max_per_session:
+            self._reject("session_limit")
+        if self.in_flight < self.max_in_flight and not self.queued:
+            self.in_flight += 1
+            self._per_session[session_id] += 1
+            metrics.inc("admission_admitted")
+            metrics.observe("admission_queue_wait_ms", 0.0)
+            return AdmissionTicket(self, session_id)
+        if self.queued >= self.max_queue:
+            self._reject("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(session_id, deque()).append(future)
+        self.queued += 1
+        self._per_session[session_id] += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was granted as the wait ended: hand it back
+                self.in_flight -= 1
+                self._forget(session_id)
+                self._grant_next()
+            else:
+                self._remove_waiter(session_id, future)
+                self._forget(session_id)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject("timeout")
+        metrics.inc("admission_admitted")
+        metrics.observe("admission_queue_wait_ms", (time.perf_counter() - start) * 1000)
+        return AdmissionTicket(self, session_id)
+
+    def _remove_waiter(self, session_id: str, future: asyncio.Future) -> None:
+        waiters = self._waiters.get(session_id)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            self.queued -= 1
+            if not waiters:
+                del self._waiters[session_id]
+
+    def _release(self, ticket: AdmissionTicket) -> None:
+        elapsed = time.perf_counter() - ticket.started
+        self._service_s = 0.8 * self._service_s + 0.2 * elapsed
+        self.in_flight -= 1
+        self._forget(ticket.session_id)
+        self._grant_next()
+
+    def _grant_next(self) -> None:
+        while self._waiters and self.in_flight < self.max_in_flight:
+            session_id, waiters = self._waiters.popitem(last=False)
+            future = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                # The session goes to the back of the line for its next query
+                self._waiters[session_id] = waiters
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "admission_in_flight": self.in_flight,
+            "admission_queued": self.queued,
+            "admission_service_ms": round(self._service_s * 1000, 1),
+        }
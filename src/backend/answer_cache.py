@@ -0,0 +1,88 @@
+from typing import List, Optional
+
+from .config import *
+from .metrics import metrics
+
+
+def invalidate_answer_cache(cur, movie_name: str) -> None:
+    """Drops cached answers that may have been built from `movie_name`'s chunks (call on re-ingestion)."""
+    cur.execute(
+        "DELETE FROM answer_cache WHERE movies = '{}' OR %s = ANY(movies)",
+        (movie_name,),
+    )
+
+
+class SemanticAnswerCache():
+    """
+    Answer cache keyed on the embedding of the standalone (rephrased) question.
+
+    Entries live in the `answer_cache` pgvector table next to `movie_chunks`. A lookup
+    returns the stored answer of the nearest cached question asked over the same set
+    of movies, provided it lies within `max_distance` (L2, same metric as retrieval).
+    The table is trimmed LRU to `max_entries` and entries older than `ttl` are ignored.
+    """
+    def __init__(self, db_pool, max_distance: float = ANSWER_CACHE_MAX_DISTANCE,
+                 max_entries: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL):
+        self.db_pool = db_pool
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    @staticmethod
+    def _movies_key(movies: Optional[List[str]]) -> List[str]:
+        # An empty list means "searched over all movies"
+        return sorted(set(movies or []))
+
+    def lookup(self, query_embedding: List[float], movies: Optional[List[str]] = None,
+               stats=None) -> Optional[str]:
+        """Returns a cached answer close enough to the query, counting the hit/miss in `stats` if given."""
+        def fetch(cur):
+            cur.execute(
+                """
+                SELECT id, answer, embedding <-> %s::vector AS distance
+                FROM answer_cache
+                WHERE movies = %s::text[]
+                  AND (%s::float IS NULL OR created_at > now() - make_interval(secs => %s::float))
+                ORDER BY distance
+                LIMIT 1
+                """,
+                (query_embedding, self._movies_key(movies), self.ttl, self.ttl),
+            )
+            row = cur.fetchone()
+            if row is None or row[2] > self.max_distance:
+                return None
+            cur.execute(
+                "UPDATE answer_cache SET hits = hits + 1, last_hit_at = now() WHERE id = %s",
+                (row[0],),
+            )
+            return row[1]
+
+        answer = self.db_pool.run(fetch)
+        # RequestStats also adds to the process-wide metrics
+        counter = stats if stats is not None else metrics
+        counter.inc("answer_cache_hits" if answer is not None else "answer_cache_misses")
+        return answer
+
+    def store(self, question: str, query_embedding: List[float], answer: str,
+              movies: Optional[List[str]] = None) -> None:
+        def insert(cur):
+            cur.execute(
+                "INSERT INTO answer_cache (movies, question, embedding, answer) VALUES (%s::text[], %s, %s::vector, %s)",
+                (self._movies_key(movies), question, query_embedding, answer),
+            )
+            cur.execute(
+                """
+                DELETE FROM answer_cache WHERE id IN (
+                    SELECT id FROM answer_cache ORDER BY last_hit_at DESC OFFSET %s)
+                """,
+                (self.max_entries,),
+            )
+            return cur.rowcount
+
+        evicted = self.db_pool.run(insert)
+        if evicted:
+            metrics.inc("answer_cache_evictions", evicted)
+
+    def stats(self) -> dict:
+        hits, misses = metrics.get("answer_cache_hits"), metrics.get("answer_cache_misses")
+        return {"answer_cache_hit_rate": hits / (hits + misses) if hits + misses else 0.0}
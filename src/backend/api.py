@@ -1,47 +1,75 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from dotenv import load_dotenv
 from .dataSchemas import Query, Health_Status
-from .SubRag import SubRag
+from .metrics import metrics, RequestStats
+from .config import DEBUG_TIMINGS, LLM_BACKEND
+from .admission import AdmissionController, AdmissionRejected
+from .llm_errors import LLMUnavailable
 from contextlib import asynccontextmanager
+import asyncio
+import json
+import math
 import os
 import sys
+import time
+
+
+def build_rag_instance():
+    """Runs in a worker thread, so the event loop keeps answering probes meanwhile."""
+    start = time.perf_counter()
+    # Heavy imports (langchain, torch, Google clients) happen here instead of at module import
+    from .SubRag import SubRag
+    print(f"ℹ️ Startup phase 'imports' took {(time.perf_counter() - start) * 1000:.0f} ms")
+    rag_instance = SubRag()
+    rag_instance.warm_up()
+    return rag_instance
+
+async def initialize_rag(app: FastAPI):
+    start = time.perf_counter()
+    try:
+        app.state.rag_instance = await asyncio.to_thread(build_rag_instance)
+        app.state.startup_status = "ready"
+        print(f"✅ RAG Instance initialized and warmed up in {time.perf_counter() - start:.1f}s.")
+    except Exception as e:
+        print(f"❌ Critical Error initializing the RAG instance.\nError: {e}")
+        app.state.startup_status = "failed"
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
-    Initializes the RAG instance and stores it in app.state for dependency access.
+    Starts building the RAG instance in the background (stored in app.state when ready).
     Handles cleanup when the application shuts down.
     """
     # 1. Initialization
-    try:
-        print("Attempting to initialize RAG instance...")
-        # Check for required environment variables early
-        if not os.getenv("GEMINI_API_KEY"):
-            # Use sys.exit or similar for a hard failure if a critical resource is missing
-            print("❌ Error not API key found")
-            sys.exit(1)
-            
-        # The SubRag constructor handles FAISS loading and chain setup
-        # Store the initialized instance directly on the app's state object
-        app.state.rag_instance = SubRag() 
-        print("✅ RAG Instance initialized successfully and stored in app.state.")
-    except Exception as e:
-        print(f"❌ Critical Error initializing the RAG instance.\nError: {e}")
-        # Set a clear state failure flag
-        app.state.rag_instance = None
+    # Check for required environment variables early
+    if LLM_BACKEND == "gemini" and not os.getenv("GEMINI_API_KEY"):
+        # Use sys.exit or similar for a hard failure if a critical resource is missing
+        print("❌ Error not API key found")
+        sys.exit(1)
+
+    # The RAG instance (model, DB, ingestion, warm-up) is built in the background:
+    # the server accepts connections at once and reports "warming" until it is ready
+    print("Attempting to initialize RAG instance...")
+    app.state.rag_instance = None
+    app.state.startup_status = "warming"
+    app.state.startup_task = asyncio.create_task(initialize_rag(app))
     
     # 2. Yield (Start serving requests)
     yield
 
     # 3. Cleanup
     print("Application shutting down...")
+    if not app.state.startup_task.done():
+        # The worker thread cannot be interrupted; its instance is closed once it finishes
+        app.state.startup_task.add_done_callback(
+            lambda _: app.state.rag_instance and app.state.rag_instance.close())
     # Access the instance from app.state for cleanup
     if hasattr(app.state, 'rag_instance') and app.state.rag_instance:
-        # Add any necessary cleanup logic here if SubRag requires it (e.g., closing connections)
-        # if hasattr(app.state.rag_instance, 'cleanup'):
-        #     await app.state.rag_instance.cleanup()
+        app.state.rag_instance.close()
         app.state.rag_instance = None
         print("RAG Instance cleaned up.")
 
@@ -52,6 +80,8 @@ load_dotenv()
 # --- App Initialization ---
 # Pass the lifespan function to the FastAPI constructor
 app = FastAPI(lifespan=lifespan)
+# Bounds concurrent queries (shared by /api/query and /api/query/stream)
+admission = AdmissionController()
 
 
 # --- CORS Configuration ---
@@ -71,44 +101,120 @@ app.add_middleware(
 async def get_health_status():
     """Default route to check API health."""
     # Check the state of the RAG instance for a more accurate health check
-    status = "online" if hasattr(app.state, 'rag_instance') and app.state.rag_instance else "degraded (RAG not initialized)"
-    return Health_Status(message="RAG API is running!", status=status)
+    rag_instance = getattr(app.state, 'rag_instance', None)
+    startup_status = getattr(app.state, 'startup_status', "warming")
+    if rag_instance:
+        status = "online"
+    elif startup_status == "warming":
+        status = "warming"
+    else:
+        status = "degraded (RAG not initialized)"
+    stats = metrics.snapshot()
+    stats.update(admission.stats())
+    if rag_instance:
+        # Some gauges query PostgreSQL (session counts): kept off the event loop
+        stats.update(await asyncio.to_thread(rag_instance.status_stats))
+    return Health_Status(message="RAG API is running!", status=status, stats=stats)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Counters, latency/distance/token histograms and component gauges in Prometheus text format."""
+    rag_instance = getattr(app.state, 'rag_instance', None)
+    gauges = {"ready": 1 if rag_instance else 0, **admission.stats()}
+    if rag_instance:
+        gauges.update(await asyncio.to_thread(rag_instance.status_stats))
+    return PlainTextResponse(metrics.render_prometheus(gauges), media_type="text/plain; version=0.0.4")
+
+@app.get("/healthz")
+async def liveness():
+    """Liveness probe: the process is up and the event loop responds."""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness():
+    """Readiness probe: 200 once the RAG instance is built and warmed up, 503 before (or if it failed)."""
+    startup_status = getattr(app.state, 'startup_status', "warming")
+    if getattr(app.state, 'rag_instance', None) is None:
+        return JSONResponse(status_code=503, content={"status": startup_status})
+    return {"status": "ready"}
 
 @app.delete("/delete_History/{uuid}")
 async def delete_History(uuid: str):
-    app.state.rag_instance._delete_history_with(uuid)
+    # A DELETE with the postgres history backend: run off the event loop
+    await asyncio.to_thread(get_rag_instance()._delete_history_with, uuid)
 
-@app.post("/api/query")
-async def process_query(query_data: Query):
-    """
-    Endpoint to receive a user query and process it through the RAG chain.
-    """
-    # 1. Access RAG Instance via app.state
+def get_rag_instance():
     rag_instance = app.state.rag_instance if hasattr(app.state, 'rag_instance') else None
     
     if rag_instance is None:
+        if getattr(app.state, 'startup_status', None) == "warming":
+            raise HTTPException(status_code=503, detail="ℹ️ RAG service is warming up, retry shortly.")
         raise HTTPException(
             status_code=503, 
             detail="❌ RAG service is not initialized. Check server logs for initialization errors."
         )
+    return rag_instance
+
+async def admit(session_id: str):
+    """Waits for a query slot; 429 with Retry-After when the server is saturated."""
+    try:
+        return await admission.acquire(session_id)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"⏳ Too many requests ({e.reason}), retry in {e.retry_after}s.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+def llm_unavailable(e: LLMUnavailable) -> HTTPException:
+    retry_after = math.ceil(e.retry_after)
+    return HTTPException(
+        status_code=503,
+        detail=f"⏳ The language model is overloaded, retry in {retry_after}s.",
+        headers={"Retry-After": str(retry_after)},
+    )
+
+def resolve_movies(rag_instance, movies):
+    try:
+        return rag_instance.resolve_movies(movies)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"❌ {e}")
+
+@app.get("/api/movies")
+async def list_movies():
+    """Movies that can be passed in the `movies` field of a query."""
+    return {"movies": get_rag_instance().movies}
+
+@app.post("/api/query")
+async def process_query(query_data: Query):
+    """
+    Endpoint to receive a user query and process it through the RAG chain.
+    """
+    # 1. Access RAG Instance via app.state
+    rag_instance = get_rag_instance()
         
     user_query = query_data.query # Access the query string from the Pydantic model
     user_session_id = query_data.session_id
+    movies = resolve_movies(rag_instance, query_data.movies)
+    ticket = await admit(user_session_id)
     
     try:
-        # Get the response from the RAG system
-        # Ensure rag_response is either synchronous or properly awaited if it's async
-        # We assume it is synchronous based on your original code: rag_instance.rag_response(user_query)
-        result = rag_instance.rag_response(user_query, user_session_id)
+        # Get the response from the RAG system without blocking the event loop
+        result = await rag_instance.arag_response(user_query, user_session_id, movies, query_data.debug)
 
         # Structure the response for the frontend
         response_data = {
             "query": result.query,
             "answer": result.answer,
+            "stats": result.stats,
         }
+        if result.timings:
+            response_data["timings"] = result.timings
         
         return response_data
 
+    except LLMUnavailable as e:
+        raise llm_unavailable(e)
     except Exception as e:
         # Catch any remaining runtime errors during RAG processing
         print(f"❌ Error processing RAG query: {e}")
@@ -119,4 +225,48 @@ async def process_query(query_data: Query):
         raise HTTPException(
             status_code=500, 
             detail=f"❌ Internal server error during RAG processing. Details: {type(e).__name__}"
-        )
\ No newline at end of file
+        )
+    finally:
+        ticket.release()
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/query/stream")
+async def process_query_stream(query_data: Query):
+    """
+    Streams the answer as Server-Sent Events: one `token` event per chunk,
+    then a final `done` event (or an `error` event if generation fails midway).
+    """
+    rag_instance = get_rag_instance()
+    movies = resolve_movies(rag_instance, query_data.movies)
+    # Admitted before the response starts, so overload is still a plain 429
+    ticket = await admit(query_data.session_id)
+
+    async def event_stream():
+        stats = RequestStats()
+        try:
+            async for token in rag_instance.astream_response(
+                    query_data.query, query_data.session_id, movies, stats):
+                yield sse_event("token", {"text": token})
+            done = {"query": query_data.query, "stats": stats.as_dict()}
+            if query_data.debug or DEBUG_TIMINGS:
+                done["timings"] = stats.timings_dict()
+            yield sse_event("done", done)
+        except LLMUnavailable as e:
+            retry_after = math.ceil(e.retry_after)
+            yield sse_event("error", {"detail": f"⏳ The language model is overloaded, retry in {retry_after}s.",
+                                      "retry_after": retry_after})
+        except Exception as e:
+            print(f"❌ Error while streaming RAG answer: {e}")
+            yield sse_event("error", {"detail": f"❌ ERROR during RAG execution: {type(e).__name__}"})
+        finally:
+            ticket.release()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also releases the slot if the client disconnects before the stream starts
+        background=BackgroundTask(ticket.release),
+    )
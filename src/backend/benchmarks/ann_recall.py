@@ -0,0 +1,112 @@
+"""
+Recall@k and latency benchmark of the pgvector ANN index against exact search.
+
+Loads random 384-d vectors (the MiniLM dimension) into a scratch table,
+computes exact top-k neighbours with a sequential scan, builds the index and
+reports recall@k and p50/p99 query latency for each query-time setting.
+
+Usage (from the project root, with the DB env vars set):
+    python -m src.backend.benchmarks.ann_recall --sizes 10000 100000 1000000 --index hnsw
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+import psycopg2
+
+from ..config import *
+from ..setup_db import get_db_string
+
+DIM = 384
+TABLE = "ann_bench"
+
+
+def load_rows(cur, n_rows: int, rng: np.random.Generator, batch: int = 50_000) -> None:
+    cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    cur.execute(f"CREATE TABLE {TABLE} (id bigint PRIMARY KEY, embedding vector({DIM}))")
+    for start in range(0, n_rows, batch):
+        vectors = rng.standard_normal((min(batch, n_rows - start), DIM), dtype=np.float32)
+        buf = io.StringIO()
+        for i, vec in enumerate(vectors, start=start):
+            buf.write(f"{i}\t[{','.join(f'{x:.6f}' for x in vec)}]\n")
+        buf.seek(0)
+        cur.copy_expert(f"COPY {TABLE} (id, embedding) FROM STDIN", buf)
+
+
+def top_k(cur, query: np.ndarray, k: int) -> list:
+    cur.execute(
+        f"SELECT id FROM {TABLE} ORDER BY embedding <-> %s::vector LIMIT %s",
+        (query.tolist(), k),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def build_index(cur, index_type: str, n_rows: int) -> float:
+    start = time.perf_counter()
+    if index_type == "hnsw":
+        cur.execute(
+            f"CREATE INDEX ON {TABLE} USING hnsw (embedding vector_l2_ops) "
+            f"WITH (m = %s, ef_construction = %s)",
+            (HNSW_M, HNSW_EF_CONSTRUCTION),
+        )
+    else:
+        lists = max(1, n_rows // 1000)
+        cur.execute(
+            f"CREATE INDEX ON {TABLE} USING ivfflat (embedding vector_l2_ops) WITH (lists = %s)",
+            (lists,),
+        )
+    return time.perf_counter() - start
+
+
+def run(n_rows: int, index_type: str, search_values: list, k: int, n_queries: int, seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    knob = "hnsw.ef_search" if index_type == "hnsw" else "ivfflat.probes"
+
+    with psycopg2.connect(get_db_string()) as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            print(f"\nℹ️ Loading {n_rows:,} rows...")
+            load_rows(cur, n_rows, rng)
+            cur.execute(f"ANALYZE {TABLE}")
+
+            queries = rng.standard_normal((n_queries, DIM), dtype=np.float32)
+            exact = [top_k(cur, q, k) for q in queries]
+
+            build_s = build_index(cur, index_type, n_rows)
+            print(f"ℹ️ {index_type} index built in {build_s:.1f}s")
+
+            print(f"{'rows':>10} {knob:>16} {'recall@' + str(k):>10} {'p50 ms':>8} {'p99 ms':>8}")
+            for value in search_values:
+                cur.execute(f"SET {knob} = %s", (value,))
+                latencies, hits = [], 0
+                for q, truth in zip(queries, exact):
+                    start = time.perf_counter()
+                    found = top_k(cur, q, k)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    hits += len(set(found) & set(truth))
+                recall = hits / (k * n_queries)
+                p50, p99 = np.percentile(latencies, [50, 99])
+                print(f"{n_rows:>10,} {value:>16} {recall:>10.3f} {p50:>8.2f} {p99:>8.2f}")
+
+            cur.execute(f"DROP TABLE {TABLE}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--index", choices=["hnsw", "ivfflat"], default=VECTOR_INDEX_TYPE or "hnsw")
+    parser.add_argument("--search", type=int, nargs="+", default=None,
+                        help="ef_search (hnsw) or probes (ivfflat) values to sweep")
+    parser.add_argument("--k", type=int, default=SEARCH_KWARGS["k"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    search_values = args.search or ([20, 40, 100, 200] if args.index == "hnsw" else [1, 10, 20, 50])
+    for n_rows in args.sizes:
+        run(n_rows, args.index, search_values, args.k, args.queries, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compares pure vector retrieval with hybrid (full-text + vector, RRF) retrieval.
+
+Each labelled question names a phrase that the right subtitle chunk contains.
+A question is a hit when that phrase appears in one of the top-k chunks.
+Reports hit rate and p50/p99 latency per mode against the ingested movie_chunks.
+
+Usage (from the project root, after ingestion):
+    python -m src.backend.benchmarks.hybrid_search --k 4
+"""
+import argparse
+import time
+
+import numpy as np
+import psycopg2
+
+from ..config import *
+from ..data_prep import get_embeddings
+from ..retrieval import search_chunks
+from ..setup_db import get_db_string, apply_search_params
+
+# (question, phrase expected in a retrieved chunk) for Terminator 3
+LABELLED_QUESTIONS = [
+    ("What does the Terminator say about the T-X being polymimetic?", "polymimetic"),
+    ("Where does Kate Brewster work?", "veterinary"),
+    ("Who developed Skynet?", "developed under brewster"),
+    ("Who says 'She'll be back'?", "she'll be back"),
+    ("Where do John and Kate have to go to survive?", "crystal peak"),
+    ("What happens when Skynet becomes self-aware?", "self-aware"),
+    ("What was the T-X designed for?", "extreme combat"),
+    ("What did Kate's father want them to do?", "shut skynet down"),
+    ("What does John say about fate?", "no fate but what"),
+    ("How old was John when the machines tried to kill him again?", "when i was 13"),
+]
+
+
+def run_mode(cur, mode: str, embeddings, k: int, repeats: int) -> dict:
+    latencies, hits = [], 0
+    for question, phrase in LABELLED_QUESTIONS:
+        query_embedding = embeddings.embed_query(question)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            results = search_chunks(cur, question, query_embedding, k, mode=mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+        hits += any(phrase in r["text"].lower() for r in results)
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return {"mode": mode, "hit_rate": hits / len(LABELLED_QUESTIONS), "p50_ms": p50, "p99_ms": p99}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=SEARCH_KWARGS["k"])
+    parser.add_argument("--repeats", type=int, default=20, help="Timed runs per question")
+    args = parser.parse_args()
+
+    embeddings = get_embeddings(HF_EMBEDDING_MODEL, DEVICE)
+    with psycopg2.connect(get_db_string()) as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            apply_search_params(cur)
+            print(f"{'mode':>8} {'hit@' + str(args.k):>8} {'p50 ms':>8} {'p99 ms':>8}")
+            for mode in ("vector", "hybrid"):
+                r = run_mode(cur, mode, embeddings, args.k, args.repeats)
+                print(f"{r['mode']:>8} {r['hit_rate']:>8.2f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Reproducible load test for /api/query.
+
+Every simulated session replays recorded multi-turn conversations (conversations.json;
+the follow-ups exercise the history and the rephrase step) at increasing concurrency
+levels. Per level it reports QPS, end-to-end p50/p95/p99, the same percentiles for every
+pipeline stage (the `timings` returned with debug=true) and the growth of the server's
+resident memory. --out saves the settings and all results as JSON.
+
+Two modes:
+    --url URL   against a running backend (with whatever LLM_BACKEND it was started with)
+    no --url    in process: the real FastAPI app behind an ASGI transport, with the
+                deterministic FakeChatModel instead of Gemini, so no API key or network is
+                needed and runs are comparable between commits.
+                --store numpy   embeds --subtitles into an artifact once, no PostgreSQL needed
+                --store pgvector ingests --subtitles into the configured database
+
+Usage (from the project root):
+    python -m src.backend.benchmarks.load_test --store numpy --concurrency 1 4 16 --out results.json
+    python -m src.backend.benchmarks.load_test --url http://127.0.0.1:8000 --concurrency 1 4 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+from ..config import *
+
+CONVERSATIONS_PATH = os.path.join(os.path.dirname(__file__), "conversations.json")
+PERCENTILES = (50, 95, 99)
+
+
+def load_conversations(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [conversation["turns"] for conversation in json.load(f)]
+
+
+def percentiles(values_ms: list) -> dict:
+    if not values_ms:
+        return {}
+    return {f"p{p}_ms": round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(values_ms, PERCENTILES))}
+
+
+async def session_worker(client: httpx.AsyncClient, conversations: list, offset: int, repeat: int,
+                         samples: list, errors: list):
+    """Replays `repeat` conversations, each in a fresh session, one turn after the other."""
+    for r in range(repeat):
+        session_id = str(uuid.uuid4())
+        for query in conversations[(offset + r) % len(conversations)]:
+            payload = {"query": query, "session_id": session_id, "debug": True}
+            start = time.perf_counter()
+            try:
+                response = await client.post("/api/query", json=payload)
+                response.raise_for_status()
+                samples.append(((time.perf_counter() - start) * 1000, response.json().get("timings", {})))
+            except httpx.HTTPError as e:
+                errors.append(repr(e))
+        await client.delete(f"/delete_History/{session_id}")
+
+
+async def server_rss_mb(client: httpx.AsyncClient) -> float:
+    response = await client.get("/api/status")
+    return response.json().get("stats", {}).get("process_rss_bytes", 0) / 2**20
+
+
+async def run_level(client: httpx.AsyncClient, conversations: list, concurrency: int, repeat: int) -> dict:
+    samples, errors = [], []
+    rss_before = await server_rss_mb(client)
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        session_worker(client, conversations, offset, repeat, samples, errors)
+        for offset in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - start
+    rss_after = await server_rss_mb(client)
+
+    stages = defaultdict(list)
+    for _, timings in samples:
+        for stage, ms in timings.items():
+            stages[stage].append(ms)
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "elapsed_s": round(elapsed, 3),
+        "qps": round(len(samples) / elapsed, 3),
+        "latency": percentiles([ms for ms, _ in samples]),
+        "stages": {stage: percentiles(values) for stage, values in sorted(stages.items())},
+        "rss_before_mb": round(rss_before, 1),
+        "rss_after_mb": round(rss_after, 1),
+        "rss_growth_mb": round(rss_after - rss_before, 1),
+    }
+
+
+def build_in_process_rag(args):
+    """SubRag with the fake LLM and the requested store, seeded from --subtitles."""
+    from ..fake_llm import FakeChatModel
+    from ..SubRag import SubRag
+
+    llm = FakeChatModel(latency_ms=args.llm_latency_ms, token_latency_ms=args.token_latency_ms)
+    if args.store == "numpy":
+        from ..ingest import build_artifact
+        from ..vector_store import NumpyVectorStore
+
+        if not os.path.exists(os.path.join(args.artifact, "manifest.json")):
+            build_artifact(args.subtitles, args.artifact)
+        rag = SubRag(llm=llm, vector_store=NumpyVectorStore.from_artifact(args.artifact))
+    else:
+        from ..data_prep import initiate_data_prep
+
+        initiate_data_prep(srt_paths=args.subtitles)
+        rag = SubRag(llm=llm)
+    rag.warm_up()
+    return rag
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_level(r: dict) -> None:
+    latency = r["latency"]
+    print(f"{r['concurrency']:>8} {r['requests']:>6} {r['errors']:>6} {r['qps']:>8.2f} "
+          f"{latency.get('p50_ms', float('nan')):>9.0f} {latency.get('p95_ms', float('nan')):>9.0f} "
+          f"{latency.get('p99_ms', float('nan')):>9.0f} {r['rss_growth_mb']:>+9.1f}")
+    for stage, p in r["stages"].items():
+        print(f"{'':>8} {stage:>24} {p['p50_ms']:>9.1f} {p['p95_ms']:>9.1f} {p['p99_ms']:>9.1f}")
+
+
+async def main_async(args):
+    conversations = load_conversations(args.conversations)
+    rag = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        from ..api import app
+
+        # ASGITransport does not run the lifespan: the instance is installed directly
+        rag = build_in_process_rag(args)
+        app.state.rag_instance = rag
+        app.state.startup_status = "ready"
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load-test",
+                                   timeout=args.timeout)
+
+    results = []
+    try:
+        rss_start = await server_rss_mb(client)
+        print(f"{'sessions':>8} {'ok':>6} {'errors':>6} {'QPS':>8} {'p50 ms':>9} {'p95 ms':>9} "
+              f"{'p99 ms':>9} {'RSS +MB':>9}")
+        for level in args.concurrency:
+            r = await run_level(client, conversations, level, args.repeat)
+            results.append(r)
+            print_level(r)
+        rss_end = await server_rss_mb(client)
+        print(f"ℹ️ Resident memory: {rss_start:.1f} MB -> {rss_end:.1f} MB ({rss_end - rss_start:+.1f} MB)")
+    finally:
+        await client.aclose()
+        if rag is not None:
+            rag.close()
+
+    if args.out:
+        report = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "mode": "remote" if args.url else "in_process",
+            "settings": {k: v for k, v in vars(args).items() if k != "out"},
+            "config": {
+                "LLM_BACKEND": "fake" if not args.url else LLM_BACKEND,
+                "VECTOR_BACKEND": "numpy" if args.store == "numpy" and not args.url else VECTOR_BACKEND,
+                "VECTOR_STORAGE": VECTOR_STORAGE,
+                "VECTOR_INDEX_TYPE": VECTOR_INDEX_TYPE,
+                "RETRIEVAL_MODE": RETRIEVAL_MODE,
+                "RERANK_ENABLED": RERANK_ENABLED,
+                "SEARCH_K": SEARCH_KWARGS["k"],
+            },
+            "rss_start_mb": round(rss_start, 1),
+            "rss_end_mb": round(rss_end, 1),
+            "levels": results,
+        }
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results saved to {args.out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="Running backend; omitted: in-process app with the fake LLM")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--repeat", type=int, default=1, help="Conversations replayed by each session")
+    parser.add_argument("--conversations", default=CONVERSATIONS_PATH)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--out", default=None, help="Write the results as JSON")
+    parser.add_argument("--store", choices=["numpy", "pgvector"], default="numpy", help="In-process store")
+    parser.add_argument("--subtitles", nargs="+", default=["subtitles/raw"], help="In-process corpus")
+    parser.add_argument("--artifact", default="data/artifacts/load_test", help="Artifact for --store numpy")
+    parser.add_argument("--llm-latency-ms", type=float, default=FAKE_LLM_LATENCY_MS)
+    parser.add_argument("--token-latency-ms", type=float, default=FAKE_LLM_TOKEN_MS)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
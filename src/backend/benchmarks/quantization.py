@@ -0,0 +1,148 @@
+"""
+Storage, index build time, latency and recall of the VECTOR_STORAGE modes.
+
+Uses the MiniLM embeddings already in movie_chunks as the corpus (optionally grown
+with --copies jittered copies, to approach a real catalogue size) and copies them into a
+scratch table once per mode:
+    vector          float32 column, float32 HNSW index (baseline)
+    halfvec         float16 column and index
+    binary          float32 column, 1-bit binary_quantize HNSW index, hamming order only
+    binary+rescore  same index, short list of --rescore re-ordered by exact distance
+Queries are the labelled benchmark questions plus jittered corpus vectors. Recall@k is
+measured against exact float32 search done in numpy.
+
+Usage (from the project root, after ingestion):
+    python -m src.backend.benchmarks.quantization --copies 200 --k 4
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+import psycopg2
+
+from ..config import *
+from ..data_prep import get_embeddings
+from ..setup_db import get_db_string
+from .hybrid_search import LABELLED_QUESTIONS
+
+TABLE = "quant_bench"
+
+
+def load_corpus(cur, copies: int, jitter: float, rng: np.random.Generator) -> np.ndarray:
+    cur.execute("SELECT embedding::real[] FROM movie_chunks")
+    base = np.array([row[0] for row in cur.fetchall()], dtype=np.float32)
+    corpus = [base]
+    for _ in range(copies - 1):
+        noisy = base + rng.normal(0, jitter, base.shape).astype(np.float32)
+        corpus.append(noisy / np.linalg.norm(noisy, axis=1, keepdims=True))
+    return np.concatenate(corpus)
+
+
+def build_queries(corpus: np.ndarray, n_queries: int, jitter: float, rng: np.random.Generator) -> np.ndarray:
+    embeddings = get_embeddings(HF_EMBEDDING_MODEL, DEVICE)
+    questions = np.array(embeddings.embed_documents([q for q, _ in LABELLED_QUESTIONS]), dtype=np.float32)
+    sampled = corpus[rng.choice(len(corpus), max(0, n_queries - len(questions)), replace=False)]
+    sampled = sampled + rng.normal(0, jitter, sampled.shape).astype(np.float32)
+    sampled /= np.linalg.norm(sampled, axis=1, keepdims=True)
+    return np.concatenate([questions, sampled])
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> list:
+    d2 = (corpus ** 2).sum(1)[None, :] - 2 * queries @ corpus.T
+    return [set(np.argpartition(row, k - 1)[:k]) for row in d2]
+
+
+def create_table(cur, column_type: str, corpus: np.ndarray, batch: int = 20_000) -> None:
+    cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    cur.execute(f"CREATE TABLE {TABLE} (id bigint PRIMARY KEY, embedding {column_type})")
+    for start in range(0, len(corpus), batch):
+        buf = io.StringIO()
+        for i, vec in enumerate(corpus[start:start + batch], start=start):
+            buf.write(f"{i}\t[{','.join('%.7g' % x for x in vec)}]\n")
+        buf.seek(0)
+        cur.copy_expert(f"COPY {TABLE} (id, embedding) FROM STDIN", buf)
+    cur.execute(f"ANALYZE {TABLE}")
+
+
+def build_index(cur, expression: str) -> float:
+    start = time.perf_counter()
+    cur.execute(
+        f"CREATE INDEX {TABLE}_idx ON {TABLE} USING hnsw ({expression}) WITH (m = %s, ef_construction = %s)",
+        (HNSW_M, HNSW_EF_CONSTRUCTION),
+    )
+    return time.perf_counter() - start
+
+
+def sizes_mb(cur) -> tuple:
+    cur.execute(f"SELECT pg_table_size('{TABLE}'), pg_relation_size('{TABLE}_idx')")
+    return tuple(size / 2**20 for size in cur.fetchone())
+
+
+def run_queries(cur, sql: str, params_for, queries: np.ndarray, truth: list, k: int) -> dict:
+    latencies, hits = [], 0
+    for q, expected in zip(queries, truth):
+        start = time.perf_counter()
+        cur.execute(sql, params_for(q.tolist()))
+        found = {row[0] for row in cur.fetchall()}
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(found & expected)
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return {"recall": hits / (k * len(queries)), "p50": p50, "p99": p99}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, default=1, help="Jittered copies of the corpus to load")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Std of the noise added to copies/queries")
+    parser.add_argument("--k", type=int, default=SEARCH_KWARGS["k"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--rescore", type=int, default=RESCORE_CANDIDATES, help="Short list re-ordered exactly")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    dim = EMBEDDING_DIM
+    hamming = f"binary_quantize(embedding)::bit({dim}) <~> binary_quantize(%s::vector)"
+    modes = [
+        ("vector", f"vector({dim})", "embedding vector_l2_ops", [
+            ("vector", f"SELECT id FROM {TABLE} ORDER BY embedding <-> %s::vector LIMIT %s",
+             lambda q: (q, args.k)),
+        ]),
+        ("halfvec", f"halfvec({dim})", "embedding halfvec_l2_ops", [
+            ("halfvec", f"SELECT id FROM {TABLE} ORDER BY embedding <-> %s::halfvec LIMIT %s",
+             lambda q: (q, args.k)),
+        ]),
+        ("binary", f"vector({dim})", f"(binary_quantize(embedding)::bit({dim})) bit_hamming_ops", [
+            ("binary", f"SELECT id FROM {TABLE} ORDER BY {hamming} LIMIT %s",
+             lambda q: (q, args.k)),
+            ("binary+rescore",
+             f"SELECT id FROM (SELECT id, embedding FROM {TABLE} ORDER BY {hamming} LIMIT %s) s "
+             f"ORDER BY embedding <-> %s::vector LIMIT %s",
+             lambda q: (q, args.rescore, q, args.k)),
+        ]),
+    ]
+
+    with psycopg2.connect(get_db_string()) as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            corpus = load_corpus(cur, args.copies, args.jitter, rng)
+            queries = build_queries(corpus, args.queries, args.jitter, rng)
+            truth = exact_top_k(corpus, queries, args.k)
+            cur.execute("SET hnsw.ef_search = %s", (max(HNSW_EF_SEARCH, args.rescore),))
+            print(f"ℹ️ {len(corpus):,} vectors, {len(queries)} queries, k={args.k}")
+            print(f"{'mode':>15} {'table MB':>9} {'index MB':>9} {'build s':>8} "
+                  f"{'recall@' + str(args.k):>9} {'p50 ms':>8} {'p99 ms':>8}")
+            for _, column_type, expression, variants in modes:
+                create_table(cur, column_type, corpus)
+                build_s = build_index(cur, expression)
+                table_mb, index_mb = sizes_mb(cur)
+                for label, sql, params_for in variants:
+                    r = run_queries(cur, sql, params_for, queries, truth, args.k)
+                    print(f"{label:>15} {table_mb:>9.1f} {index_mb:>9.1f} {build_s:>8.2f} "
+                          f"{r['recall']:>9.3f} {r['p50']:>8.2f} {r['p99']:>8.2f}")
+            cur.execute(f"DROP TABLE {TABLE}")
+
+
+if __name__ == "__main__":
+    main()
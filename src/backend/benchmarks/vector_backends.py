@@ -0,0 +1,98 @@
+"""
+Query latency of the in-process numpy vector store against pgvector.
+
+For each corpus size, random 384-d vectors are searched with:
+    numpy f32 / f16   NumpyVectorStore, one query at a time and in batches of --batch
+    pgvector          the same vectors in a scratch table, with the configured ANN index
+Reports p50/p99 latency per query. The numpy store is exact, so its recall is always 1.0.
+
+Usage (from the project root, with the DB env vars set; --no-db skips pgvector):
+    python -m src.backend.benchmarks.vector_backends --sizes 10000 100000 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import psycopg2
+
+from ..config import *
+from ..setup_db import get_db_string
+from ..vector_store import NumpyVectorStore
+from .ann_recall import DIM, TABLE, load_rows, top_k, build_index
+
+
+def percentiles(latencies: list) -> tuple:
+    return tuple(np.percentile(latencies, [50, 99]))
+
+
+def bench_numpy(vectors: np.ndarray, queries: np.ndarray, k: int, batch: int) -> dict:
+    chunks = [{"id": i, "text": "", "movie": "bench", "start_time": None, "end_time": None}
+              for i in range(len(vectors))]
+    store = NumpyVectorStore(vectors, chunks)
+    single = []
+    for q in queries:
+        start = time.perf_counter()
+        store.search("", q, k)
+        single.append((time.perf_counter() - start) * 1000)
+    batched = []
+    for offset in range(0, len(queries), batch):
+        block = queries[offset:offset + batch]
+        start = time.perf_counter()
+        store.search_batch(block, k)
+        batched.append((time.perf_counter() - start) * 1000 / len(block))
+    return {"single": percentiles(single), "batched": percentiles(batched), "mb": vectors.nbytes / 2**20}
+
+
+def bench_pgvector(n_rows: int, queries: np.ndarray, k: int, seed: int) -> tuple:
+    with psycopg2.connect(get_db_string()) as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            # Same seed as the numpy run, so both search the same vectors
+            load_rows(cur, n_rows, np.random.default_rng(seed))
+            build_index(cur, VECTOR_INDEX_TYPE or "hnsw", n_rows)
+            cur.execute(f"ANALYZE {TABLE}")
+            cur.execute("SET hnsw.ef_search = %s", (HNSW_EF_SEARCH,))
+            latencies = []
+            for q in queries:
+                start = time.perf_counter()
+                top_k(cur, q, k)
+                latencies.append((time.perf_counter() - start) * 1000)
+            cur.execute(f"DROP TABLE {TABLE}")
+    return percentiles(latencies)
+
+
+def random_vectors(n_rows: int, seed: int, batch: int = 50_000) -> np.ndarray:
+    # Generated in the same batches as ann_recall.load_rows, so the values match the table
+    rng = np.random.default_rng(seed)
+    return np.concatenate([
+        rng.standard_normal((min(batch, n_rows - start), DIM), dtype=np.float32)
+        for start in range(0, n_rows, batch)
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--k", type=int, default=SEARCH_KWARGS["k"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=32, help="Queries per search_batch call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-db", action="store_true", help="Only benchmark the numpy store")
+    args = parser.parse_args()
+
+    queries = np.random.default_rng(args.seed + 1).standard_normal((args.queries, DIM), dtype=np.float32)
+    print(f"{'rows':>10} {'backend':>12} {'MB':>8} {'p50 ms':>8} {'p99 ms':>8} {'batched p50':>12}")
+    for n_rows in args.sizes:
+        vectors = random_vectors(n_rows, args.seed)
+        for dtype in ("float32", "float16"):
+            r = bench_numpy(vectors.astype(dtype), queries, args.k, args.batch)
+            print(f"{n_rows:>10,} {'numpy ' + dtype[-2:]:>12} {r['mb']:>8.1f} "
+                  f"{r['single'][0]:>8.2f} {r['single'][1]:>8.2f} {r['batched'][0]:>12.3f}")
+        del vectors
+        if not args.no_db:
+            p50, p99 = bench_pgvector(n_rows, queries, args.k, args.seed)
+            print(f"{n_rows:>10,} {'pgvector':>12} {'':>8} {p50:>8.2f} {p99:>8.2f} {'':>12}")
+
+
+if __name__ == "__main__":
+    main()
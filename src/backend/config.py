@@ -1,5 +1,5 @@
 # --- FILE PATHS ---
-# Paths are relative to the project root
+# Paths are relative to the project root (directories are scanned for *.srt)
 SRT_PATHS = ["subtitles/raw/Terminator.3.srt"]
 CLEANED_TEXT_PATH = "data/processed/cleaned_dialogue.txt"
 FAISS_INDEX_PATH = "index/movie_script_faiss_index"
@@ -9,12 +9,125 @@ DEVICE = "cpu"
 # --- CHUNKING PARAMETERS ---
 CHUNK_SIZE = 1000    # Max characters per text chunk
 CHUNK_OVERLAP = 200 # Overlap between adjacent chunks
+SCENE_GAP_SECONDS = 30.0  # Silence between cues that starts a new chunk (likely scene change)
+CHUNK_MAX_SECONDS = 180.0 # Max time span covered by one chunk
 
 # --- EMBEDDING PARAMETERS ---
 # Model used for generating vector embeddings (runs locally)
 HF_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384  # Output size of HF_EMBEDDING_MODEL
+EMBED_EXECUTOR_WORKERS = 2  # Threads used by the API for query embeddings
+
+# --- QUERY EMBEDDING CACHE ---
+EMBED_CACHE_SIZE = 10000        # Query embeddings kept in memory (LRU, 0 disables the cache)
+EMBED_CACHE_TTL = None          # Seconds before a cached embedding expires (None = never)
+EMBED_CACHE_SQLITE_PATH = None  # e.g. "cache/query_embeddings.sqlite3" to persist across restarts
+EMBED_CACHE_SQLITE_MAX_ROWS = 100000  # Rows kept in the SQLite file (oldest pruned first)
+
+# --- QUERY EMBEDDING BATCHING ---
+EMBED_BATCHING_ENABLED = True  # Embed concurrent queries together in one forward pass
+EMBED_BATCH_MAX_SIZE = 32      # Most queries per batch
+EMBED_BATCH_WAIT_MS = 5        # How long a batch waits for more queries (0: only those already queued)
+
+# --- INGESTION PARAMETERS ---
+EMBED_BATCH_SIZE = 64   # Chunks embedded per embed_documents call
+INSERT_PAGE_SIZE = 500  # Rows sent per INSERT statement by execute_values
+INGEST_WORKERS = 4      # Processes used to parse/clean/split SRT files
+INGEST_QUEUE_SIZE = 8   # Parsed movies buffered ahead of the embedding thread
+INGEST_ON_STARTUP = True  # Embed SRT_PATHS when the API starts on an empty DB (False: use the ingest CLI)
+ARTIFACT_DIR = "data/artifacts/subtitles"  # Output of `python -m src.backend.ingest build`
+ARTIFACT_DTYPE = "float16"  # "float16" halves the artifact size, "float32" keeps it exact
  
+# --- SEMANTIC ANSWER CACHE ---
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_MAX_DISTANCE = 0.25  # Max L2 distance between rephrased questions to reuse an answer
+ANSWER_CACHE_SIZE = 5000          # Cached answers kept in the DB (least recently hit are evicted)
+ANSWER_CACHE_TTL = 86400          # Seconds a cached answer stays valid (None = until re-ingestion)
+
+# --- SESSION HISTORY ---
+# "memory" keeps histories in the process (single worker only);
+# "postgres" shares them through the DB so uvicorn can run with --workers N
+HISTORY_BACKEND = "memory"
+SESSION_SWEEP_INTERVAL = 300  # Seconds between idle-session sweeps of the postgres backend
+SESSION_MAX_SESSIONS = 10000  # Sessions kept in memory (least recently used are evicted)
+SESSION_IDLE_TTL = 3600       # Seconds of inactivity before a session is dropped
+SESSION_MAX_MESSAGES = 10     # Most recent messages kept per session (5 question/answer turns)
+SESSION_MAX_TOKENS = 2000     # Approximate token cap of the history sent to the rephrase prompt
+
+# --- DATABASE POOL PARAMETERS ---
+DB_POOL_MIN = 1                 # Connections opened at startup
+DB_POOL_MAX = 10                # Max concurrent connections used by the API
+DB_POOL_TIMEOUT = 10            # Seconds to wait for a free connection
+DB_HEALTH_CHECK_INTERVAL = 30   # Ping connections idle for longer than this (seconds)
+DB_RETRIES = 1                  # Retries on a fresh connection after a dropped one
+
+# --- VECTOR INDEX PARAMETERS ---
+VECTOR_INDEX_TYPE = "hnsw"   # "hnsw", "ivfflat" or None for exact search
+HNSW_M = 16                  # Graph degree (build time)
+HNSW_EF_CONSTRUCTION = 64    # Candidate list size while building
+HNSW_EF_SEARCH = 40          # Candidate list size per query (higher = better recall, slower)
+IVFFLAT_LISTS = 100          # Number of clusters (build time, ~rows/1000)
+IVFFLAT_PROBES = 10          # Clusters scanned per query (higher = better recall, slower)
+
+# --- VECTOR STORAGE (pgvector >= 0.7) ---
+# "vector": float32 column and index; "halfvec": float16 column and index (half the size);
+# "binary": float32 column with a 1-bit binary_quantize index (32x smaller), optionally rescored
+VECTOR_STORAGE = "vector"
+RESCORE_ENABLED = True   # binary: re-order the short list by exact float32 distance
+RESCORE_CANDIDATES = 40  # binary: candidates read from the hamming index per search
+
+# --- VECTOR STORE ---
+# "postgres" searches pgvector; "numpy" keeps every chunk vector in the API process
+# (exact search, no DB round trip; single node, reload the API after ingesting)
+VECTOR_BACKEND = "postgres"
+NUMPY_INDEX_SOURCE = "db"     # "db" copies movie_chunks at startup, "artifact" memory-maps ARTIFACT_DIR
+NUMPY_INDEX_DTYPE = "float32" # Matrix dtype when loading from the DB ("float16" halves memory but is converted per query, ~8x slower)
+
 # --- LLM/RAG PARAMETERS ---
+# "gemini", or "fake": a deterministic offline stand-in (benchmarks, CI; no GEMINI_API_KEY needed)
+LLM_BACKEND = "gemini"
+FAKE_LLM_LATENCY_MS = 300  # fake: delay before the first token
+FAKE_LLM_TOKEN_MS = 5      # fake: delay per streamed word
 GEMINI_MODEL_NAME = "gemini-2.5-flash"
 SEARCH_KWARGS = {"k": 4} # Number of chunks to retrieve for each query
+RETRIEVAL_MODE = "vector"  # "vector" (pgvector only) or "hybrid" (full-text + vector, rank-fused)
+HYBRID_CANDIDATES = 20     # Candidates taken from each side before fusion
+RRF_K = 60                 # Reciprocal-rank fusion constant (higher = flatter rank weights)
+TEXT_SEARCH_CONFIG = "english"  # Postgres text search configuration for the tsvector column
+
+CONTEXT_EXPAND_SECONDS = 0  # Add neighbouring chunks within this many seconds of each hit (0 = off)
+
+# --- CONTEXT ASSEMBLY ---
+CONTEXT_MAX_TOKENS = 1500          # Approximate token budget of the retrieved context in the QA prompt
+CONTEXT_MIN_PASSAGE_TOKENS = 50    # Smallest leftover budget worth filling with a cut passage
+CONTEXT_MERGE_GAP_SECONDS = 2.0    # Hits of one movie closer than this are merged into one passage
+CONTEXT_DEDUP_THRESHOLD = 0.8      # Share of a passage's words already in a better one that drops it
+
+# --- LLM RESILIENCE ---
+LLM_TIMEOUT_S = 30            # Per-call timeout of the Gemini client
+LLM_MAX_RETRIES = 2           # Retries of rate-limited/transient LLM errors (exponential backoff, full jitter)
+LLM_RETRY_BASE_S = 0.5        # First backoff ceiling, doubled per retry
+LLM_RETRY_MAX_S = 4.0         # Largest backoff ceiling
+LLM_BREAKER_FAILURES = 5      # Consecutive transient failures that open the circuit
+LLM_BREAKER_COOLDOWN_S = 30   # Seconds the open circuit fails fast before letting one trial call through
+
+# --- ADMISSION CONTROL ---
+# Queries beyond these limits get 429 + Retry-After instead of piling up behind a slow LLM
+ADMISSION_MAX_IN_FLIGHT = 16    # Queries processed at once
+ADMISSION_MAX_QUEUE = 64        # Queries waiting for a slot
+ADMISSION_MAX_WAIT_S = 5.0      # Longest wait for a slot (well under the frontend's 15 s timeout)
+ADMISSION_MAX_PER_SESSION = 2   # Queries one session may have in flight or waiting
+
+# --- RE-RANKING ---
+RERANK_ENABLED = False     # Re-score over-fetched candidates with a local cross-encoder
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 20     # Candidates fetched from pgvector before keeping the best k
+RERANK_TIME_BUDGET_MS = 150  # Re-ranking is skipped while its average latency exceeds this
+RERANK_PROBE_EVERY = 20    # While over budget, still re-rank every Nth request to detect recovery
 TEMPERATURE = 0.0   # LLM creativity (0.0 is deterministic/factual)
+# When to call the LLM to rephrase follow-ups into standalone questions:
+# "always", "history" (skip on the first turn) or "heuristic" (also skip questions without pronouns/follow-up cues)
+REPHRASE_MODE = "heuristic"
+
+# --- OBSERVABILITY ---
+DEBUG_TIMINGS = False  # Add the per-stage timing breakdown to every response (or send "debug": true per query)
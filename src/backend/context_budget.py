@@ -0,0 +1,124 @@
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+from .config import *
+from .metrics import RequestStats, TOKEN_BUCKETS
+from .session_store import approx_text_tokens
+
+
+def join_overlapping(first: str, second: str, min_chars: int = 12) -> str:
+    """
+    Concatenates two passages whose time ranges overlap, dropping the start of `second`
+    that repeats the end of `first` (the cues chunk_cues carries over as CHUNK_OVERLAP).
+    Only a repeat of whole words, at least `min_chars` long, counts as overlap, so a
+    chance match of a short word or word ending never deletes dialogue.
+    """
+    if len(second) >= min_chars and f" {second} " in f" {first} ":
+        return first
+    # A carried-over prefix ends at a word boundary of `second` and starts at one of `first`
+    boundaries = [i for i, ch in enumerate(second[:len(first) + 1]) if ch == " "]
+    for cut in reversed(boundaries):
+        if cut < min_chars:
+            break
+        if first.endswith(second[:cut]) and (cut == len(first) or first[-cut - 1] == " "):
+            return first + second[cut:]
+    return first + " " + second
+
+
+def merge_passages(documents: List[Document], max_gap: float = CONTEXT_MERGE_GAP_SECONDS) -> List[dict]:
+    """
+    Merges retrieved chunks of the same movie whose time ranges overlap or are less than
+    `max_gap` seconds apart into one chronological passage (repeated cues are only
+    looked for when the ranges really overlap). Passages are returned best
+    hit first (rank = position of their best chunk in `documents`).
+    """
+    passages = [
+        {"movie": doc.metadata.get("movie"), "start_time": doc.metadata.get("start_time"),
+         "end_time": doc.metadata.get("end_time"), "text": doc.page_content, "rank": rank}
+        for rank, doc in enumerate(documents)
+    ]
+    timed = [p for p in passages if p["start_time"] is not None and p["end_time"] is not None]
+    merged = [p for p in passages if p["start_time"] is None or p["end_time"] is None]
+
+    last = None
+    for p in sorted(timed, key=lambda p: (p["movie"] or "", p["start_time"])):
+        if last is not None and last["movie"] == p["movie"] and p["start_time"] <= last["end_time"] + max_gap:
+            if p["start_time"] < last["end_time"]:
+                last["text"] = join_overlapping(last["text"], p["text"])
+            else:
+                # Adjacent but not overlapping: nothing was carried over
+                last["text"] = last["text"] + " " + p["text"]
+            last["end_time"] = max(last["end_time"], p["end_time"])
+            last["rank"] = min(last["rank"], p["rank"])
+            continue
+        last = dict(p)
+        merged.append(last)
+    return sorted(merged, key=lambda p: p["rank"])
+
+
+def drop_near_duplicates(passages: List[dict], threshold: float = CONTEXT_DEDUP_THRESHOLD) -> List[dict]:
+    """
+    Drops a passage when most of its words already appear in a better-ranked one
+    (overlap coefficient |A & B| / min(|A|, |B|) >= threshold), e.g. the same line
+    repeated in another scene or movie.
+    """
+    kept, word_sets = [], []
+    for p in passages:
+        words = set(p["text"].lower().split())
+        if any(len(words & other) / max(1, min(len(words), len(other))) >= threshold for other in word_sets):
+            continue
+        kept.append(p)
+        word_sets.append(words)
+    return kept
+
+
+def _format_time(seconds: float) -> str:
+    hours, rest = divmod(int(seconds), 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}"
+
+
+def format_passage(passage: dict) -> str:
+    """One header line ([movie h:mm:ss-h:mm:ss]) followed by the dialogue."""
+    header = passage["movie"] or "unknown"
+    if passage["start_time"] is not None and passage["end_time"] is not None:
+        header += f" {_format_time(passage['start_time'])}-{_format_time(passage['end_time'])}"
+    return f"[{header}]\n{passage['text']}"
+
+
+def assemble_context(documents: List[Document], max_tokens: int = CONTEXT_MAX_TOKENS,
+                     stats: Optional[RequestStats] = None) -> str:
+    """
+    Builds the `{final_context}` of the QA prompt from the retrieved documents: merges
+    overlapping/adjacent chunks, drops near-duplicates, formats each passage compactly and
+    keeps the best passages within roughly `max_tokens`. The first passage that does not fit
+    is cut at a word boundary if at least CONTEXT_MIN_PASSAGE_TOKENS of budget are left
+    (the best passage is always kept, cut if needed).
+    """
+    stats = stats or RequestStats()
+    passages = merge_passages(documents)
+    merged = len(documents) - len(passages)
+    unique = drop_near_duplicates(passages)
+
+    parts, used, trimmed = [], 0, 0
+    for passage in unique:
+        block = format_passage(passage)
+        tokens = approx_text_tokens(block)
+        if used + tokens > max_tokens:
+            remaining = max_tokens - used
+            trimmed = len(unique) - len(parts)
+            if remaining >= CONTEXT_MIN_PASSAGE_TOKENS or not parts:
+                block = block[:max(remaining, 1) * 4].rsplit(" ", 1)[0] + " …"
+                parts.append(block)
+                used += approx_text_tokens(block)
+            break
+        parts.append(block)
+        used += tokens
+
+    stats.inc("context_chunks_merged", merged)
+    stats.inc("context_chunks_deduped", len(passages) - len(unique))
+    stats.inc("context_passages_trimmed", trimmed)
+    stats.inc("context_tokens", used)
+    stats.observe("context_size_tokens", used, TOKEN_BUCKETS)
+    return "\n\n".join(parts)
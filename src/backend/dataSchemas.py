@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from typing import Dict, List, Optional
 
 
 class Query(BaseModel):
@@ -7,9 +8,13 @@ class Query(BaseModel):
     Attributes:
         query (str): The natural language question to be answered.
         session_id (str): A unique identifier for the user's session.
+        movies (Optional[List[str]]): Movies to search in (all loaded movies if omitted).
+        debug (bool): Return the per-stage timing breakdown with the answer.
     """
     query: str
     session_id: str
+    movies: Optional[List[str]] = None
+    debug: bool = False
 
 class Response(BaseModel):
     """
@@ -17,11 +22,16 @@ class Response(BaseModel):
     Attributes:
         query (str): The original query.
         answer (str): The generated answer.
+        stats (Dict[str, int]): Per-request counters (e.g. LLM calls made and saved).
+        timings (Dict[str, float]): Milliseconds per stage, only when debugging is enabled.
     """
     query: str
     answer: str
+    stats: Dict[str, int] = {}
+    timings: Dict[str, float] = {}
 
 class Health_Status(BaseModel):
     message: str
     status: str
+    stats: Dict[str, float] = {}
 
@@ -1,14 +1,26 @@
-from langchain_community.document_loaders import SRTLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from typing import List
+from typing import List, TYPE_CHECKING
 import re
+import time
+import hashlib
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from .config import *
 import psycopg2
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
-from .setup_db import get_db_string, setup_db
+from .setup_db import (get_db_string, setup_db, rebuild_vector_index, ensure_movie_index,
+                       advisory_lock, INGEST_LOCK_KEY)
+from .answer_cache import invalidate_answer_cache
+from .srt_parser import read_srt, chunk_cues
 from pathlib import Path
 
+if TYPE_CHECKING:
+    # Imported lazily at runtime: langchain_huggingface pulls in torch, which would slow down
+    # every process that imports this module (API startup, ingestion worker processes)
+    from langchain_huggingface import HuggingFaceEmbeddings
+
 
 load_dotenv()
 def clean_subtitle_text(text):
@@ -39,71 +51,295 @@ def save_clean_subs(cleanSubtiltes:str, pathToSave:str)->None:
         print(f"An error occurred while writing the file: {e}")
     return
 
-def split_text(documents: List[str], chunk_size: int = 1000, chunk_overlap: int = 200):
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,  # A good size for dialogue
-        chunk_overlap=chunk_overlap   # Ensures context flow
-    )
-    split_chunks = text_splitter.split_documents(documents)
-    return split_chunks
+_embedding_models = {}
+_embedding_models_lock = threading.Lock()
 
 def get_embeddings(
         model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
-        device: str = "cpu") -> HuggingFaceEmbeddings:
-    """Initializes and returns the local HuggingFace embedding model."""
+        device: str = "cpu") -> "HuggingFaceEmbeddings":
+    """
+    Initializes and returns the local HuggingFace embedding model.
+    The model is loaded once per process and shared by every caller (API, ingestion, benchmarks).
+    """
+    with _embedding_models_lock:
+        key = (model_name, device)
+        if key not in _embedding_models:
+            from langchain_huggingface import HuggingFaceEmbeddings
 
-    print(f"Loading local embedding model: {model_name}")
-    embeddings = HuggingFaceEmbeddings(
-        model_name=model_name,
-        model_kwargs={'device': device} 
-    )
-    print(f"✅ Successfully loaded local embedding model: {model_name}")
-    return embeddings
+            print(f"Loading local embedding model: {model_name}")
+            start = time.perf_counter()
+            _embedding_models[key] = HuggingFaceEmbeddings(
+                model_name=model_name,
+                model_kwargs={'device': device} 
+            )
+            print(f"✅ Successfully loaded local embedding model: {model_name} "
+                  f"({time.perf_counter() - start:.1f}s)")
+        return _embedding_models[key]
 
-def store_in_db(split_chunks, embeddings_model, movie_name:str):
-    setup_db()
+def embed_in_batches(texts: List[str], embeddings: "HuggingFaceEmbeddings",
+                     batch_size: int = EMBED_BATCH_SIZE) -> List[List[float]]:
+    """Embeds texts with `embed_documents`, `batch_size` texts per forward pass."""
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embeddings.embed_documents(texts[start:start + batch_size]))
+    return vectors
 
+def chunk_hash(text: str) -> str:
+    """md5 of a chunk's text, identical to Postgres' md5(content) so old rows can be backfilled in SQL."""
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+def _chunk_key(content_hash: str, start_time, end_time) -> tuple:
+    # Times are stored as `real`, so compare them at millisecond precision
+    return (content_hash,
+            None if start_time is None else round(start_time, 3),
+            None if end_time is None else round(end_time, 3))
+
+def store_in_db(split_chunks, embeddings: "HuggingFaceEmbeddings", movie_name:str,
+                batch_size: int = EMBED_BATCH_SIZE,
+                source_path: str = None, file_hash: str = None) -> int:
+    """
+    Synchronises the stored chunks of one movie with `split_chunks`, in one transaction.
+    Chunks already stored with the same text and timestamps are left untouched, stale ones
+    are deleted and only new ones are inserted. A new chunk reuses the vector of any stored
+    chunk with the same content hash (from any movie), and each remaining distinct text is
+    embedded once, so repeated lines and corrected files cost only what actually changed.
+    When `file_hash` is given, the manifest row is marked 'done' in the same transaction.
+    Returns the number of chunks inserted.
+    """
     with psycopg2.connect(get_db_string()) as conn:
         with conn.cursor() as cur:
-            if movie_exists(movie_name):
-                print(f"ℹ️ The movie '{movie_name}' already exists in the database.")
-                return
-            else:
-                print(f"ℹ️ The movie '{movie_name}' don't exists in the database.")
-
-            # 3. Insert chunks
-            print(f"ℹ️ Storing {len(split_chunks)} chunks in Postgres...")
-            embeddings = get_embeddings(embeddings_model)
+            cur.execute(
+                "SELECT id, content_hash, start_time, end_time FROM movie_chunks WHERE movie_name = %s",
+                (movie_name,),
+            )
+            stored = {}
+            for row_id, content_hash, start_time, end_time in cur.fetchall():
+                stored.setdefault(_chunk_key(content_hash, start_time, end_time), []).append(row_id)
+
+            new_chunks = []
             for doc in split_chunks:
-                # Generate the embedding vector
-                vector = embeddings.embed_query(doc.page_content)
-                
+                content_hash = chunk_hash(doc.page_content)
+                key = _chunk_key(content_hash, doc.metadata.get("start_time"), doc.metadata.get("end_time"))
+                if stored.get(key):
+                    stored[key].pop()
+                else:
+                    new_chunks.append((content_hash, doc))
+            stale_ids = [row_id for ids in stored.values() for row_id in ids]
+            unchanged = len(split_chunks) - len(new_chunks)
+
+            # Vectors of texts that are already embedded somewhere in the table
+            vectors = {}
+            if new_chunks:
                 cur.execute(
-                    "INSERT INTO movie_chunks (content, embedding, movie_name) VALUES (%s, %s, %s)",
-                    (doc.page_content, vector, movie_name)
+                    """
+                    SELECT DISTINCT ON (content_hash) content_hash, embedding::real[]
+                    FROM movie_chunks WHERE content_hash = ANY(%s)
+                    """,
+                    (list({content_hash for content_hash, _ in new_chunks}),),
+                )
+                vectors = dict(cur.fetchall())
+            reused = len(vectors)
+
+            to_embed = {}
+            for content_hash, doc in new_chunks:
+                if content_hash not in vectors:
+                    to_embed.setdefault(content_hash, doc.page_content)
+            if to_embed:
+                print(f"ℹ️ Embedding {len(to_embed)} new texts for '{movie_name}' (batch size {batch_size})...")
+                vectors.update(zip(to_embed, embed_in_batches(list(to_embed.values()), embeddings, batch_size)))
+
+            if new_chunks:
+                execute_values(
+                    cur,
+                    """INSERT INTO movie_chunks (content, embedding, movie_name, start_time, end_time, content_hash)
+                    VALUES %s""",
+                    [
+                        (doc.page_content, vectors[content_hash], movie_name,
+                         doc.metadata.get("start_time"), doc.metadata.get("end_time"), content_hash)
+                        for content_hash, doc in new_chunks
+                    ],
+                    page_size=INSERT_PAGE_SIZE,
                 )
-            
+            if stale_ids:
+                cur.execute("DELETE FROM movie_chunks WHERE id = ANY(%s)", (stale_ids,))
+            if new_chunks or stale_ids:
+                ensure_movie_index(cur, movie_name)
+                invalidate_answer_cache(cur, movie_name)
+            if file_hash is not None:
+                upsert_manifest(cur, movie_name, source_path, file_hash, len(split_chunks), "done")
             conn.commit()
-        print("✅ All vectors stored successfully!")
+    print(f"✅ '{movie_name}': {unchanged} chunks unchanged, {len(new_chunks)} inserted "
+          f"({len(to_embed)} embedded, {reused} reused vectors), {len(stale_ids)} deleted.")
+    return len(new_chunks)
 
-def movie_exists(movie_name):
-    # Use 'with' for both connection and cursor to ensure they close properly
-    with psycopg2.connect(dsn=get_db_string()) as conn:
+# --- INGESTION MANIFEST ---
+def compute_file_hash(path: str) -> str:
+    """SHA-256 of the raw subtitle file, used to detect already-ingested files."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def upsert_manifest(cur, movie_name: str, source_path: str, file_hash: str,
+                    chunk_count: int, status: str) -> None:
+    cur.execute(
+        """
+        INSERT INTO ingest_manifest (movie_name, source_path, file_hash, chunk_count, status, updated_at)
+        VALUES (%s, %s, %s, %s, %s, now())
+        ON CONFLICT (movie_name) DO UPDATE SET
+            source_path = EXCLUDED.source_path,
+            file_hash = EXCLUDED.file_hash,
+            chunk_count = EXCLUDED.chunk_count,
+            status = EXCLUDED.status,
+            updated_at = now()
+        """,
+        (movie_name, source_path, file_hash, chunk_count, status),
+    )
+
+def set_manifest_status(movie_name: str, source_path: str, file_hash: str,
+                        chunk_count: int, status: str) -> None:
+    with psycopg2.connect(get_db_string()) as conn:
         with conn.cursor() as cur:
-            # 2. Add a comma after movie_name to make it a tuple
-            cur.execute(
-                "SELECT EXISTS(SELECT 1 FROM movie_chunks WHERE LOWER(movie_name) = LOWER(%s) LIMIT 1)", 
-                (movie_name,)
-            )
+            upsert_manifest(cur, movie_name, source_path, file_hash, chunk_count, status)
+            conn.commit()
+
+def load_manifest() -> dict:
+    """Returns {movie_name: (file_hash, status)} for every movie seen by a previous run."""
+    with psycopg2.connect(get_db_string()) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT movie_name, file_hash, status FROM ingest_manifest")
+            return {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+
+# --- PARALLEL INGESTION ---
+def resolve_srt_paths(paths: List[str]) -> List[str]:
+    """Expands directories in `paths` to the .srt files they contain."""
+    resolved = []
+    for path in paths:
+        p = Path(path)
+        if p.is_dir():
+            resolved.extend(str(f) for f in sorted(p.rglob("*.srt")))
+        else:
+            resolved.append(str(p))
+    return resolved
+
+def prepare_movie(movie_path: str) -> dict:
+    """
+    CPU-bound part of the ingestion (parse, clean, split). Runs inside a worker
+    process, so it must stay a top-level function that only returns picklable data.
+    Cues are cleaned one by one and grouped by dialogue gaps, so every chunk keeps
+    the start/end time of the scene it comes from.
+    """
+    cues = read_srt(movie_path)
+    return {
+        "movie_name": Path(movie_path).stem,
+        "source_path": movie_path,
+        "chunks": chunk_cues(cues, CHUNK_SIZE, CHUNK_OVERLAP, clean=clean_subtitle_text),
+    }
+
+def parse_pool(workers: int = INGEST_WORKERS) -> ProcessPoolExecutor:
+    """
+    Process pool for prepare_movie. Workers are spawned, not forked: the caller is
+    multi-threaded (API startup thread, embedding threads, torch thread pools) and a
+    forked child can deadlock on a lock another thread held at fork time. Spawned
+    workers also start without the parent's torch and model in memory.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def _embedding_worker(work_queue: queue.Queue, embeddings: "HuggingFaceEmbeddings",
+                      hashes: dict, totals: dict) -> None:
+    """
+    Consumes prepared movies from the queue and embeds/stores them one by one.
+    It must keep draining the bounded queue whatever fails (even recording the failure,
+    e.g. during a DB outage), otherwise the producer blocks forever on `put`.
+    """
+    while True:
+        item = work_queue.get()
+        if item is None:
+            break
+        movie_name, source_path = item["movie_name"], item["source_path"]
+        file_hash = hashes.get(source_path)
+        try:
+            set_manifest_status(movie_name, source_path, file_hash, len(item["chunks"]), "in_progress")
+            stored = store_in_db(item["chunks"], embeddings, movie_name,
+                                 source_path=source_path, file_hash=file_hash)
+            totals["chunks"] += stored
+            totals["movies"] += 1
+        except Exception as e:
+            print(f"❌ Failed to ingest '{movie_name}': {e}")
+            try:
+                set_manifest_status(movie_name, source_path, file_hash, 0, "failed")
+            except Exception as status_error:
+                # Left 'in_progress' (or unrecorded): the next run resumes it anyway
+                print(f"❌ Could not mark '{movie_name}' as failed: {status_error}")
+
+def initiate_data_prep(embeddings: "HuggingFaceEmbeddings" = None,
+                       srt_paths: List[str] = None,
+                       workers: int = INGEST_WORKERS):
+    """
+    Ingests every SRT file in `srt_paths` (defaults to SRT_PATHS; directories are expanded).
+    Parsing/cleaning/splitting runs in a process pool, while a single embedding thread
+    fed from a bounded queue embeds and stores the results with one shared model.
+    Movies already marked 'done' in the manifest with the same file hash are skipped,
+    so a crashed run can simply be restarted. Changed files are re-ingested incrementally:
+    only their new or modified chunks are embedded.
+    Concurrent runs (several API workers, the CLI) are serialised by an advisory lock.
+    """
+    setup_db()
+    if embeddings is None:
+        embeddings = get_embeddings(HF_EMBEDDING_MODEL, DEVICE)
+
+    # Held from the manifest read to the end: API workers starting together on an empty DB
+    # would otherwise each find nothing ingested and store every movie once per worker
+    with advisory_lock(INGEST_LOCK_KEY):
+        paths = resolve_srt_paths(srt_paths or SRT_PATHS)
+        manifest = load_manifest()
+        hashes = {}
+        pending = []
+        for path in paths:
+            movie_name = Path(path).stem
+            hashes[path] = compute_file_hash(path)
+            previous_hash, status = manifest.get(movie_name, (None, None))
+            if status == "done":
+                if previous_hash in (None, hashes[path]):
+                    continue
+                print(f"ℹ️ '{movie_name}' changed since it was ingested; updating its chunks.")
+            elif status in ("in_progress", "failed"):
+                print(f"ℹ️ Resuming '{movie_name}' (previous status: {status}).")
+            pending.append(path)
+
+        print(f"ℹ️ {len(pending)} of {len(paths)} subtitle files need ingestion.")
+        if not pending:
+            return
+
+        start = time.perf_counter()
+        totals = {"chunks": 0, "movies": 0}
+        work_queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        embedder = threading.Thread(
+            target=_embedding_worker, args=(work_queue, embeddings, hashes, totals), daemon=True)
+        embedder.start()
+
+        try:
+            with parse_pool(workers) as pool:
+                futures = {pool.submit(prepare_movie, path): path for path in pending}
+                for future in as_completed(futures):
+                    path = futures[future]
+                    try:
+                        work_queue.put(future.result())
+                    except Exception as e:
+                        print(f"❌ Failed to parse '{path}': {e}")
+                        try:
+                            set_manifest_status(Path(path).stem, path, hashes[path], 0, "failed")
+                        except Exception as status_error:
+                            print(f"❌ Could not mark '{path}' as failed: {status_error}")
+        finally:
+            work_queue.put(None)
+            embedder.join()
+
+        if totals["chunks"]:
+            rebuild_vector_index()
 
-            res = cur.fetchone()
-            return res[0] if res else False
-
-def initiate_data_prep():
-    for movie_path in SRT_PATHS:
-        loader = SRTLoader(movie_path)
-        docs = loader.load()
-        for doc in docs:
-            doc.page_content = clean_subtitle_text(doc.page_content)
-        split_chunks = split_text(docs, CHUNK_SIZE, CHUNK_OVERLAP)
-        store_in_db(split_chunks, HF_EMBEDDING_MODEL, Path(SRT_PATHS[0]).stem)
\ No newline at end of file
+        elapsed = time.perf_counter() - start
+        rate = totals["chunks"] / elapsed if elapsed > 0 else 0.0
+        print(f"✅ Ingested {totals['chunks']} chunks from {totals['movies']} movies "
+              f"in {elapsed:.1f}s ({rate:.1f} chunks/sec)")
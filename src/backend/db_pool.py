@@ -0,0 +1,120 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from psycopg2 import InterfaceError, OperationalError
+from psycopg2.extensions import connection as PGConnection
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+from .config import *
+from .setup_db import get_db_string, apply_search_params
+
+
+class PooledConnection(PGConnection):
+    """A connection that carries its own pool bookkeeping, so a new connection never inherits a closed one's."""
+    configured = False  # session settings (autocommit, search params) applied
+    last_used = 0.0  # time the connection was last returned to the pool
+
+
+class _KeepIdlePool(ThreadedConnectionPool):
+    """
+    Opens `minconn` connections up front but keeps up to `maxconn` idle ones open:
+    psycopg2 closes every returned connection beyond `minconn`, so the pool would
+    otherwise reconnect on nearly every checkout under concurrency.
+    """
+    def __init__(self, minconn: int, maxconn: int, *args, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self.minconn = maxconn
+
+
+class DBPool():
+    """
+    Bounded, thread-safe pool of pgvector connections.
+
+    - At most `maxconn` connections are checked out; extra callers wait up to `timeout` seconds.
+    - `minconn` connections are opened at startup; up to `maxconn` are kept open once used.
+    - Connections idle for longer than `health_check_interval` are pinged before reuse.
+    - Broken connections are discarded and replaced, and `run` retries once on a fresh one,
+      so a DB restart does not take the service down until the backend restarts.
+    """
+    def __init__(self, minconn: int = DB_POOL_MIN, maxconn: int = DB_POOL_MAX,
+                 timeout: float = DB_POOL_TIMEOUT,
+                 health_check_interval: float = DB_HEALTH_CHECK_INTERVAL):
+        self._pool = _KeepIdlePool(minconn, maxconn, dsn=get_db_string(),
+                                   connection_factory=PooledConnection)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._timeout = timeout
+        self._health_check_interval = health_check_interval
+
+    def _configure(self, conn) -> None:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            apply_search_params(cur)
+        conn.configured = True
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        idle_for = time.monotonic() - conn.last_used
+        if idle_for < self._health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            return True
+        except (OperationalError, InterfaceError):
+            return False
+
+    def _discard(self, conn) -> None:
+        self._pool.putconn(conn, close=True)
+
+    def _checkout(self):
+        for _ in range(self._pool.maxconn + 1):
+            conn = self._pool.getconn()
+            if self._is_healthy(conn):
+                # autocommit is checked too: `run` never commits, so writes must not sit in a transaction
+                if not conn.configured or not conn.autocommit:
+                    try:
+                        self._configure(conn)
+                    except Exception:
+                        # Not handed out yet, so nobody else would return it to the pool
+                        self._discard(conn)
+                        raise
+                return conn
+            print("⚠️ Discarding broken DB connection")
+            self._discard(conn)
+        raise OperationalError("❌ Could not obtain a healthy DB connection")
+
+    @contextmanager
+    def connection(self):
+        if not self._slots.acquire(timeout=self._timeout):
+            raise PoolError(f"❌ No DB connection available after {self._timeout}s")
+        conn = None
+        try:
+            conn = self._checkout()
+            yield conn
+        except (OperationalError, InterfaceError):
+            if conn is not None:
+                self._discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                conn.last_used = time.monotonic()
+                self._pool.putconn(conn)
+            self._slots.release()
+
+    def run(self, fn, retries: int = DB_RETRIES):
+        """Calls `fn(cursor)` on a pooled connection, retrying on a fresh one if the connection drops."""
+        for attempt in range(retries + 1):
+            try:
+                with self.connection() as conn:
+                    with conn.cursor() as cur:
+                        return fn(cur)
+            except (OperationalError, InterfaceError) as e:
+                if attempt == retries:
+                    raise
+                print(f"⚠️ DB connection failed ({e}); retrying with a fresh connection")
+
+    def close(self) -> None:
+        self._pool.closeall()
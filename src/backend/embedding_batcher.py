@@ -0,0 +1,130 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional
+
+from .config import *
+from .embedding_cache import QueryEmbeddingCache
+from .metrics import metrics, BATCH_SIZE_BUCKETS
+
+
+class EmbeddingBatcher():
+    """
+    Micro-batching front of the embedding model for concurrent query embeddings.
+
+    Callers enqueue their text and wait on a Future. One worker thread takes the first
+    queued query, gathers whatever else arrives within `max_wait_ms` (up to
+    `max_batch_size`), embeds the batch in a single `embed_documents` call and resolves
+    every Future. A query already waiting for a batch (same normalised text) is
+    coalesced onto the pending Future instead of being embedded twice.
+
+    Assumes a symmetric model (MiniLM: `embed_query(t) == embed_documents([t])[0]`).
+    """
+    def __init__(self, embeddings, max_batch_size: int = EMBED_BATCH_MAX_SIZE,
+                 max_wait_ms: float = EMBED_BATCH_WAIT_MS):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()  # (key, text, enqueued_at), None stops the worker
+        self._pending = {}  # normalised text -> Future shared by every caller
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        key = QueryEmbeddingCache.normalize(text)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("❌ The embedding batcher is closed")
+            future = self._pending.get(key)
+            if future is not None:
+                metrics.inc("embed_batch_coalesced")
+                return future
+            future = self._pending[key] = Future()
+        self._queue.put((key, text, time.perf_counter()))
+        return future
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.submit(text).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # Shielded: a cancelled caller must not cancel the Future shared with coalesced callers
+        return await asyncio.shield(asyncio.wrap_future(self.submit(text)))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Already a batch: straight to the model
+        return self.embeddings.embed_documents(texts)
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            try:
+                remaining = deadline - time.perf_counter()
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Stop after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            try:
+                self._embed_batch(batch)
+            except Exception as e:
+                # Never let the worker die: every later query embedding would hang
+                print(f"❌ Embedding batch failed: {e}")
+                self._resolve(batch, None, e)
+
+    def _embed_batch(self, batch: list) -> None:
+        started = time.perf_counter()
+        for _, _, enqueued_at in batch:
+            metrics.observe("embed_batch_queue_wait_ms", (started - enqueued_at) * 1000)
+        metrics.observe("embed_batch_size", len(batch), BATCH_SIZE_BUCKETS)
+        metrics.inc("embed_batches")
+        metrics.inc("embed_batch_queries", len(batch))
+        try:
+            vectors, error = self.embeddings.embed_documents([text for _, text, _ in batch]), None
+        except Exception as e:
+            vectors, error = None, e
+        metrics.observe("embed_batch_latency_ms", (time.perf_counter() - started) * 1000)
+        self._resolve(batch, vectors, error)
+
+    def _resolve(self, batch: list, vectors: Optional[list], error: Optional[Exception]) -> None:
+        with self._lock:
+            futures = [self._pending.pop(key, None) for key, _, _ in batch]
+        for i, future in enumerate(futures):
+            # A Future cancelled meanwhile (or already resolved) is skipped
+            if future is None or not future.set_running_or_notify_cancel():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(vectors[i])
+
+    def stats(self) -> dict:
+        batches, queries = metrics.get("embed_batches"), metrics.get("embed_batch_queries")
+        return {
+            "embed_batch_queue_depth": self._queue.qsize(),
+            "embed_batch_avg_size": queries / batches if batches else 0.0,
+        }
+
+    def close(self) -> None:
+        """Embeds what is already queued, then stops the worker thread."""
+        with self._lock:
+            self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout=10)
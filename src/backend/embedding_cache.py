@@ -0,0 +1,204 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional
+
+from .config import *
+from .metrics import metrics
+
+
+class QueryEmbeddingCache():
+    """
+    Bounded cache in front of `embeddings.embed_query`.
+
+    Entries are keyed by model name + normalised query text, evicted LRU once
+    `max_entries` is reached and optionally expired after `ttl` seconds. When
+    `sqlite_path` is set, vectors are also written to a SQLite file so the cache
+    survives restarts; disk hits are promoted back into memory. Expired rows are deleted
+    when read, and every PRUNE_EVERY writes (and on open) the file is pruned back to
+    `max_disk_entries` rows, oldest first.
+    """
+    PRUNE_EVERY = 256  # Disk writes between two prunes of the SQLite file
+
+    def __init__(self, embeddings, model_name: str,
+                 max_entries: int = EMBED_CACHE_SIZE,
+                 ttl: Optional[float] = EMBED_CACHE_TTL,
+                 sqlite_path: Optional[str] = EMBED_CACHE_SQLITE_PATH,
+                 max_disk_entries: int = EMBED_CACHE_SQLITE_MAX_ROWS):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()  # key -> (vector, stored_at)
+        self._lock = threading.Lock()
+        self._db = self._open_sqlite(sqlite_path) if sqlite_path else None
+        self._db_lock = threading.Lock()
+        self._disk_writes = 0
+        if self._db is not None:
+            self._prune_disk()
+
+    @staticmethod
+    def _open_sqlite(path: str) -> sqlite3.Connection:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings "
+            "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, stored_at REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS query_embeddings_stored_at ON query_embeddings (stored_at)")
+        db.commit()
+        return db
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        # MiniLM is uncased, so case and extra whitespace do not change the embedding
+        return " ".join(text.lower().split())
+
+    def _key(self, text: str) -> str:
+        return f"{self.model_name}\x00{self.normalize(text)}"
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def _get_memory(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            vector, stored_at = entry
+            if self._expired(stored_at):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return vector
+
+    def _put_memory(self, key: str, vector: List[float], stored_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (vector, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.inc("embed_cache_evictions")
+
+    def _get_disk(self, key: str):
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT vector, stored_at FROM query_embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        if self._expired(row[1]):
+            with self._db_lock:
+                self._db.execute("DELETE FROM query_embeddings WHERE key = ?", (key,))
+                self._db.commit()
+            return None
+        return array("f", row[0]).tolist(), row[1]
+
+    def _put_disk(self, key: str, vector: List[float], stored_at: float) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO query_embeddings (key, vector, stored_at) VALUES (?, ?, ?)",
+                (key, array("f", vector).tobytes(), stored_at),
+            )
+            self._db.commit()
+            self._disk_writes += 1
+            prune = self._disk_writes % self.PRUNE_EVERY == 0
+        if prune:
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """Deletes expired rows, then the oldest ones beyond `max_disk_entries`."""
+        with self._db_lock:
+            deleted = 0
+            if self.ttl is not None:
+                deleted += self._db.execute(
+                    "DELETE FROM query_embeddings WHERE stored_at < ?", (time.time() - self.ttl,)
+                ).rowcount
+            deleted += self._db.execute(
+                "DELETE FROM query_embeddings WHERE key IN "
+                "(SELECT key FROM query_embeddings ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,),
+            ).rowcount
+            self._db.commit()
+        if deleted:
+            metrics.inc("embed_cache_disk_evictions", deleted)
+
+    def _lookup_memory(self, key: str) -> Optional[List[float]]:
+        vector = self._get_memory(key)
+        if vector is not None:
+            metrics.inc("embed_cache_hits")
+        return vector
+
+    def _lookup_disk(self, key: str) -> Optional[List[float]]:
+        """Second tier after a memory miss; counts the miss if the disk has nothing either."""
+        if self._db is not None:
+            entry = self._get_disk(key)
+            if entry is not None:
+                metrics.inc("embed_cache_hits")
+                metrics.inc("embed_cache_disk_hits")
+                self._put_memory(key, *entry)
+                return entry[0]
+
+        metrics.inc("embed_cache_misses")
+        return None
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.max_entries <= 0:
+            return self.embeddings.embed_query(text)
+
+        key = self._key(text)
+        vector = self._lookup_memory(key)
+        if vector is None:
+            vector = self._lookup_disk(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            stored_at = time.time()
+            self._put_memory(key, vector, stored_at)
+            if self._db is not None:
+                self._put_disk(key, vector, stored_at)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """
+        Same as `embed_query`, awaiting the model's `aembed_query` on a miss
+        (the EmbeddingBatcher, so no thread is held while a batch fills).
+        Only the memory tier runs on the event loop: the SQLite read and the
+        INSERT + commit (an fsync) run in a worker thread.
+        """
+        if self.max_entries <= 0:
+            return await self.embeddings.aembed_query(text)
+
+        key = self._key(text)
+        vector = self._lookup_memory(key)
+        if vector is None and self._db is not None:
+            vector = await asyncio.to_thread(self._lookup_disk, key)
+        elif vector is None:
+            vector = self._lookup_disk(key)  # no disk tier: only counts the miss
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            stored_at = time.time()
+            self._put_memory(key, vector, stored_at)
+            if self._db is not None:
+                await asyncio.to_thread(self._put_disk, key, vector, stored_at)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def stats(self) -> dict:
+        hits, misses = metrics.get("embed_cache_hits"), metrics.get("embed_cache_misses")
+        with self._lock:
+            size = len(self._entries)
+        return {
+            "embed_cache_size": size,
+            "embed_cache_hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from typing import AsyncIterator, Iterator, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from .config import *
+from .session_store import approx_text_tokens
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic offline stand-in for ChatGoogleGenerativeAI (benchmarks, CI, air-gapped boxes).
+
+    Rephrase prompts get the question back unchanged, answer prompts get the first
+    `answer_words` words of the retrieved context. `latency_ms` is spent before the first
+    token and `token_latency_ms` per streamed word (asyncio.sleep on the async paths, so
+    concurrent requests overlap like real network calls). Usage metadata is approximate.
+    """
+    latency_ms: float = FAKE_LLM_LATENCY_MS
+    token_latency_ms: float = FAKE_LLM_TOKEN_MS
+    answer_words: int = 40
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        system = next((str(m.content) for m in messages if m.type == "system"), "")
+        question = next((str(m.content) for m in reversed(messages) if m.type == "human"), "")
+        if "reformulating user queries" in system:
+            return question
+        context = system.split("context:", 1)[-1].split()
+        return " ".join(context[:self.answer_words]) or "I don't know based on the script."
+
+    @staticmethod
+    def _usage(messages: List[BaseMessage], text: str) -> dict:
+        prompt_tokens = sum(approx_text_tokens(str(m.content)) for m in messages)
+        completion_tokens = approx_text_tokens(text)
+        return {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def _delay_s(self, text: str) -> float:
+        return (self.latency_ms + self.token_latency_ms * len(text.split())) / 1000
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = self._reply(messages)
+        time.sleep(self._delay_s(text))
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = self._reply(messages)
+        await asyncio.sleep(self._delay_s(text))
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, messages: List[BaseMessage], text: str) -> List[ChatGenerationChunk]:
+        words = text.split(" ")
+        chunks = []
+        for i, word in enumerate(words):
+            last = i == len(words) - 1
+            chunks.append(ChatGenerationChunk(message=AIMessageChunk(
+                content=word if i == 0 else " " + word,
+                # Reported once, on the last chunk, so the aggregated message is not double counted
+                usage_metadata=self._usage(messages, text) if last else None,
+            )))
+        return chunks
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        text = self._reply(messages)
+        time.sleep(self.latency_ms / 1000)
+        for i, chunk in enumerate(self._chunks(messages, text)):
+            if i:
+                time.sleep(self.token_latency_ms / 1000)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        text = self._reply(messages)
+        await asyncio.sleep(self.latency_ms / 1000)
+        for i, chunk in enumerate(self._chunks(messages, text)):
+            if i:
+                await asyncio.sleep(self.token_latency_ms / 1000)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
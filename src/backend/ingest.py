@@ -0,0 +1,223 @@
+"""
+Offline ingestion: embed subtitles into an on-disk artifact, then bulk-load it into Postgres.
+
+    build  Parses/chunks SRT files and embeds every distinct chunk text once. Writes to a directory:
+             embeddings.npy  (n_texts, dim) float16/float32 matrix, readable with mmap
+             chunks.jsonl    one chunk per line: movie, content, start/end time, hash, vector row
+             manifest.json   embedding model, dtype and the source file hash of every movie
+    load   Streams the artifact into movie_chunks with COPY, one transaction per movie.
+           Movies whose file hash is already 'done' in the ingest manifest are skipped.
+
+The build step needs no database and can run on a separate (GPU) box. The API then
+only has to load the artifact, which takes seconds (see INGEST_ON_STARTUP).
+
+Usage (from the project root):
+    python -m src.backend.ingest build subtitles/raw --out data/artifacts/subtitles --dtype float16
+    python -m src.backend.ingest load data/artifacts/subtitles
+"""
+import argparse
+import io
+import json
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import psycopg2
+
+from .config import *
+from .data_prep import (get_embeddings, embed_in_batches, resolve_srt_paths, prepare_movie, parse_pool,
+                        compute_file_hash, chunk_hash, load_manifest, upsert_manifest)
+from .setup_db import (get_db_string, setup_db, rebuild_vector_index, ensure_movie_index,
+                       advisory_lock, INGEST_LOCK_KEY)
+from .answer_cache import invalidate_answer_cache
+
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.jsonl"
+MANIFEST_FILE = "manifest.json"
+
+
+def build_artifact(srt_paths: List[str], out_dir: str = ARTIFACT_DIR, dtype: str = ARTIFACT_DTYPE,
+                   embeddings=None, workers: int = INGEST_WORKERS,
+                   batch_size: int = EMBED_BATCH_SIZE) -> dict:
+    """Embeds `srt_paths` into `out_dir`. Returns the artifact manifest."""
+    start = time.perf_counter()
+    paths = resolve_srt_paths(srt_paths)
+    with parse_pool(workers) as pool:
+        prepared = list(pool.map(prepare_movie, paths))
+
+    # One vector row per distinct chunk text, shared by every chunk (and movie) that repeats it
+    rows = {}
+    chunks = []
+    for item in prepared:
+        for doc in item["chunks"]:
+            content_hash = chunk_hash(doc.page_content)
+            row = rows.setdefault(content_hash, (len(rows), doc.page_content))[0]
+            chunks.append({
+                "movie": item["movie_name"],
+                "content": doc.page_content,
+                "start_time": doc.metadata.get("start_time"),
+                "end_time": doc.metadata.get("end_time"),
+                "content_hash": content_hash,
+                "vector": row,
+            })
+    print(f"ℹ️ {len(chunks)} chunks from {len(prepared)} movies, {len(rows)} distinct texts to embed.")
+
+    if embeddings is None:
+        embeddings = get_embeddings(HF_EMBEDDING_MODEL, DEVICE)
+    texts = [text for _, text in rows.values()]
+    dim = len(embeddings.embed_query("dimension probe"))
+
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    # The manifest is written last, so a half-written artifact is never loadable
+    (out / MANIFEST_FILE).unlink(missing_ok=True)
+    matrix = np.lib.format.open_memmap(out / EMBEDDINGS_FILE, mode="w+", dtype=dtype, shape=(len(texts), dim))
+    for offset in range(0, len(texts), batch_size * 16):
+        block = texts[offset:offset + batch_size * 16]
+        matrix[offset:offset + len(block)] = np.asarray(embed_in_batches(block, embeddings, batch_size))
+    matrix.flush()
+    del matrix
+
+    with open(out / CHUNKS_FILE, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+
+    manifest = {
+        "model": HF_EMBEDDING_MODEL,
+        "dim": dim,
+        "dtype": dtype,
+        "chunks": len(chunks),
+        "vectors": len(texts),
+        "movies": {
+            item["movie_name"]: {"source_path": item["source_path"],
+                                 "file_hash": compute_file_hash(item["source_path"])}
+            for item in prepared
+        },
+    }
+    with open(out / MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Artifact written to {out} in {elapsed:.1f}s ({len(texts) / max(elapsed, 1e-9):.1f} texts/sec)")
+    return manifest
+
+
+def open_artifact(artifact_dir: str = ARTIFACT_DIR):
+    """Returns (manifest, memory-mapped vectors) of an artifact built by `build_artifact`."""
+    path = Path(artifact_dir)
+    with open(path / MANIFEST_FILE, encoding="utf-8") as f:
+        manifest = json.load(f)
+    return manifest, np.load(path / EMBEDDINGS_FILE, mmap_mode="r")
+
+
+def iter_artifact_chunks(artifact_dir: str = ARTIFACT_DIR):
+    with open(Path(artifact_dir) / CHUNKS_FILE, encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _copy_field(value) -> str:
+    """Formats one value for COPY's text format."""
+    if value is None:
+        return "\\N"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def _vector_literal(vector: np.ndarray) -> str:
+    return "[" + ",".join("%.7g" % x for x in vector.tolist()) + "]"
+
+
+def _copy_movie(cur, movie_name: str, chunks: List[dict], vectors: np.ndarray) -> None:
+    buffer = io.StringIO()
+    for chunk in chunks:
+        buffer.write("\t".join((
+            _copy_field(chunk["content"]),
+            _vector_literal(vectors[chunk["vector"]]),
+            _copy_field(movie_name),
+            _copy_field(chunk["start_time"]),
+            _copy_field(chunk["end_time"]),
+            _copy_field(chunk["content_hash"]),
+        )) + "\n")
+    buffer.seek(0)
+    cur.copy_expert(
+        "COPY movie_chunks (content, embedding, movie_name, start_time, end_time, content_hash) FROM STDIN",
+        buffer,
+    )
+
+
+def load_artifact(artifact_dir: str = ARTIFACT_DIR, force: bool = False) -> int:
+    """
+    Bulk-loads an artifact into movie_chunks. Each movie is replaced in one transaction
+    (delete, COPY, per-movie index, answer-cache invalidation, manifest 'done'), so a
+    crash leaves every movie either fully old or fully new. Returns the chunks loaded.
+    """
+    start = time.perf_counter()
+    manifest, vectors = open_artifact(artifact_dir)
+    if manifest["model"] != HF_EMBEDDING_MODEL:
+        raise ValueError(f"❌ Artifact was embedded with {manifest['model']}, "
+                         f"but HF_EMBEDDING_MODEL is {HF_EMBEDDING_MODEL}")
+
+    setup_db()
+    with advisory_lock(INGEST_LOCK_KEY):
+        ingested = load_manifest()
+        pending = {
+            movie: info for movie, info in manifest["movies"].items()
+            if force or ingested.get(movie) != (info["file_hash"], "done")
+        }
+        print(f"ℹ️ {len(pending)} of {len(manifest['movies'])} movies in the artifact need loading.")
+        if not pending:
+            return 0
+
+        by_movie = {}
+        for chunk in iter_artifact_chunks(artifact_dir):
+            if chunk["movie"] in pending:
+                by_movie.setdefault(chunk["movie"], []).append(chunk)
+
+        loaded = 0
+        with psycopg2.connect(get_db_string()) as conn:
+            with conn.cursor() as cur:
+                for movie_name, info in pending.items():
+                    chunks = by_movie.get(movie_name, [])
+                    cur.execute("DELETE FROM movie_chunks WHERE movie_name = %s", (movie_name,))
+                    _copy_movie(cur, movie_name, chunks, vectors)
+                    ensure_movie_index(cur, movie_name)
+                    invalidate_answer_cache(cur, movie_name)
+                    upsert_manifest(cur, movie_name, info["source_path"], info["file_hash"], len(chunks), "done")
+                    conn.commit()
+                    loaded += len(chunks)
+                    print(f"✅ Loaded {len(chunks)} chunks for '{movie_name}'")
+
+    if loaded:
+        rebuild_vector_index()
+    elapsed = time.perf_counter() - start
+    print(f"✅ Loaded {loaded} chunks in {elapsed:.1f}s ({loaded / max(elapsed, 1e-9):.1f} chunks/sec)")
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Embed SRT files into an artifact (no DB needed)")
+    build.add_argument("paths", nargs="*", help="SRT files or directories (default: SRT_PATHS)")
+    build.add_argument("--out", default=ARTIFACT_DIR)
+    build.add_argument("--dtype", choices=("float16", "float32"), default=ARTIFACT_DTYPE)
+    build.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    build.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+
+    load = commands.add_parser("load", help="Bulk-load an artifact into Postgres")
+    load.add_argument("artifact", nargs="?", default=ARTIFACT_DIR)
+    load.add_argument("--force", action="store_true", help="Reload movies even if their file hash is unchanged")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        build_artifact(args.paths or SRT_PATHS, args.out, args.dtype,
+                       workers=args.workers, batch_size=args.batch_size)
+    else:
+        load_artifact(args.artifact, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
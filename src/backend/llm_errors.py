@@ -0,0 +1,9 @@
+# Kept free of langchain imports: api.py imports it at module load, before the
+# startup thread has pulled in the heavy dependencies
+
+
+class LLMUnavailable(Exception):
+    """The LLM is rate-limiting or failing: the circuit is open or the retries ran out."""
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
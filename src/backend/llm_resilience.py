@@ -0,0 +1,187 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from .config import *
+from .llm_errors import LLMUnavailable
+from .metrics import metrics
+
+# Exception class names of rate limits and transient failures (google.api_core, httpx, builtins)
+_TRANSIENT_ERRORS = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+    "InternalServerError", "GatewayTimeout", "TimeoutError", "ReadTimeout", "ConnectTimeout",
+    "ConnectError", "ConnectionError", "RemoteDisconnected",
+}
+_TRANSIENT_MARKERS = ("429", "RESOURCE_EXHAUSTED", "rate limit", "503", "UNAVAILABLE", "overloaded")
+
+
+def is_transient(error: BaseException) -> bool:
+    """Rate limits, timeouts and 5xx are worth retrying; bad requests and auth errors are not."""
+    if type(error).__name__ in _TRANSIENT_ERRORS or getattr(error, "code", None) in (429, 500, 502, 503, 504):
+        return True
+    text = str(error)
+    return any(marker in text for marker in _TRANSIENT_MARKERS)
+
+
+def backoff_delay(attempt: int, base: float = LLM_RETRY_BASE_S, cap: float = LLM_RETRY_MAX_S) -> float:
+    # "Full jitter": clients retrying after the same rate limit spread out instead of retrying together
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker():
+    """
+    Closed -> open after `failures` consecutive transient failures; open calls fail at once
+    for `cooldown` seconds; then half-open lets a single trial call through, which closes the
+    circuit on success or re-opens it on failure. Shared by the event loop and worker threads.
+    """
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN_S):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self.state == "closed":
+                return 0.0
+            return max(1.0, self.cooldown - (time.monotonic() - self._opened_at))
+
+    def before_call(self) -> None:
+        """Raises LLMUnavailable while the circuit is open (or its trial call is already running)."""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._trial_running = False
+            if self.state == "closed":
+                return
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return
+            remaining = max(1.0, self.cooldown - (time.monotonic() - self._opened_at))
+        metrics.inc("llm_circuit_rejected")
+        raise LLMUnavailable("❌ The LLM is unavailable (circuit open)", retry_after=remaining)
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                print("✅ LLM circuit closed")
+            self.state = "closed"
+            self._consecutive = 0
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive += 1
+            if self.state == "half_open" or self._consecutive >= self.failures:
+                if self.state != "open":
+                    print(f"⚠️ LLM circuit opened for {self.cooldown:.0f}s after {self._consecutive} failures")
+                    metrics.inc("llm_circuit_opened")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+
+    def record_other(self) -> None:
+        """A non-transient error: says nothing about the LLM's health, but ends a trial call."""
+        with self._lock:
+            self._trial_running = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"llm_circuit_open": int(self.state == "open"), "llm_consecutive_failures": self._consecutive}
+
+
+class ResilientChatModel(BaseChatModel):
+    """
+    Wraps a chat model with retry-with-jitter and a circuit breaker.
+
+    Transient errors are retried up to `max_retries` times with full-jitter exponential
+    backoff, and each one counts towards opening the breaker. A stream is only retried if
+    it failed before its first chunk. Once retries run out, or while the circuit is open,
+    LLMUnavailable is raised, which the API turns into a 503 with Retry-After.
+    The inner model is called through its private methods, so callbacks fire once, here.
+    """
+    inner: BaseChatModel
+    breaker: CircuitBreaker
+    max_retries: int = LLM_MAX_RETRIES
+
+    @property
+    def _llm_type(self) -> str:
+        return f"resilient-{self.inner._llm_type}"
+
+    def _on_error(self, error: Exception, attempt: int, started: bool = False) -> None:
+        """Records a failed attempt and returns when it should be retried; raises otherwise."""
+        transient = is_transient(error)
+        if transient:
+            metrics.inc("llm_transient_errors")
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_other()
+        if not transient or started:
+            raise error
+        if attempt >= self.max_retries or self.breaker.state != "closed":
+            retry_after = max(1.0, self.breaker.retry_after(), LLM_RETRY_MAX_S)
+            raise LLMUnavailable(f"❌ The LLM is unavailable: {type(error).__name__}",
+                                 retry_after=retry_after) from error
+        metrics.inc("llm_retries")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            try:
+                result = self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                self._on_error(e, attempt)
+                time.sleep(backoff_delay(attempt))
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            try:
+                result = await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                self._on_error(e, attempt)
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            self.breaker.record_success()
+            return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            started = False
+            try:
+                for chunk in self.inner._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                self._on_error(e, attempt, started)
+                time.sleep(backoff_delay(attempt))
+                continue
+            self.breaker.record_success()
+            return
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            started = False
+            try:
+                async for chunk in self.inner._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                self._on_error(e, attempt, started)
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            self.breaker.record_success()
+            return
@@ -0,0 +1,144 @@
+import bisect
+import os
+import re
+import resource
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+DISTANCE_BUCKETS = (0.2, 0.4, 0.6, 0.8, 1.0, 1.2, 1.4, 1.6, 2.0)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def process_rss_bytes() -> int:
+    """Current resident set size of this process (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Histogram():
+    """Cumulative-bucket histogram in the Prometheus layout (le = upper bound, inclusive)."""
+    def __init__(self, buckets: tuple):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list:
+        total, result = 0, []
+        for upper, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((upper, total))
+        return result
+
+
+def _metric_name(name: str) -> str:
+    return "subrag_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _format_labels(labels: tuple) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in labels)
+
+
+class Metrics():
+    """Process-wide counters and histograms, safe to update from request threads and the event loop."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}  # (name, labels) -> Histogram
+
+    def inc(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0.0)
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS_MS, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+    def render_prometheus(self, gauges: dict = None) -> str:
+        """Text exposition format: counters, histograms, then the given point-in-time gauges."""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self._counters.items()):
+                metric = _metric_name(name if name.endswith("_total") else name + "_total")
+                lines += [f"# TYPE {metric} counter", f"{metric} {value:g}"]
+            typed = set()
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                metric = _metric_name(name)
+                if metric not in typed:
+                    lines.append(f"# TYPE {metric} histogram")
+                    typed.add(metric)
+                for upper, count in histogram.cumulative():
+                    le = "+Inf" if upper == float("inf") else f"{upper:g}"
+                    bucket_labels = _format_labels(labels + (("le", le),))
+                    lines.append(f"{metric}_bucket{{{bucket_labels}}} {count}")
+                suffix = f"{{{_format_labels(labels)}}}" if labels else ""
+                lines.append(f"{metric}_sum{suffix} {histogram.sum:g}")
+                lines.append(f"{metric}_count{suffix} {histogram.count}")
+        for name, value in sorted((gauges or {}).items()):
+            metric = _metric_name(name)
+            lines += [f"# TYPE {metric} gauge", f"{metric} {float(value):g}"]
+        return "\n".join(lines) + "\n"
+
+
+class RequestStats():
+    """
+    Counters and stage timings for a single request. They travel through the chain in
+    the input dict; every increment is also added to the process-wide `metrics`, and
+    every stage duration is observed in the `stage_latency_ms` histogram.
+    """
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.timings = defaultdict(float)  # stage -> milliseconds
+
+    def inc(self, name: str, value: int = 1) -> None:
+        self.counters[name] += value
+        metrics.inc(name, value)
+
+    def observe(self, name: str, value: float, buckets: tuple) -> None:
+        metrics.observe(name, value, buckets)
+
+    def record(self, stage: str, elapsed_ms: float) -> None:
+        self.timings[stage] += elapsed_ms
+        metrics.observe("stage_latency_ms", elapsed_ms, LATENCY_BUCKETS_MS, stage=stage)
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - start) * 1000)
+
+    def as_dict(self) -> dict:
+        return dict(self.counters)
+
+    def timings_dict(self) -> dict:
+        return {stage: round(ms, 2) for stage, ms in self.timings.items()}
+
+
+metrics = Metrics()
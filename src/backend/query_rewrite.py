@@ -0,0 +1,37 @@
+import re
+from typing import List
+
+from langchain_core.messages import BaseMessage
+
+# Words that usually point back at something said earlier in the conversation
+_ANAPHORA = re.compile(
+    r"\b(he|him|his|she|her|hers|they|them|their|theirs|it|its|this|that|these|those|"
+    r"there|then|one|ones|former|latter|same|such|else|other|another)\b",
+    re.IGNORECASE,
+)
+# Openers of follow-up fragments such as "and the T-X?" or "what about Kate?"
+_FOLLOW_UP = re.compile(
+    r"^\s*(and|but|so|also|then|what about|how about|why not|and then|what else)\b",
+    re.IGNORECASE,
+)
+MIN_STANDALONE_WORDS = 4
+
+
+def needs_rephrase(question: str, chat_history: List[BaseMessage], mode: str = "heuristic") -> bool:
+    """
+    Decides whether the rephrase LLM call is needed.
+    - "always": every turn is rephrased (original behaviour).
+    - "history": skipped only on the first turn, when there is nothing to resolve against.
+    - "heuristic": also skipped when the question has no pronouns, follow-up opener or
+      fragment-like length, i.e. it already reads as standalone.
+    """
+    if mode == "always":
+        return True
+    if not chat_history:
+        return False
+    if mode == "history":
+        return True
+
+    if _ANAPHORA.search(question) or _FOLLOW_UP.search(question):
+        return True
+    return len(question.split()) < MIN_STANDALONE_WORDS
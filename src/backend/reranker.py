@@ -0,0 +1,72 @@
+import threading
+import time
+from typing import List
+
+from .config import *
+from .metrics import metrics
+
+
+class CrossEncoderReranker():
+    """
+    Re-orders over-fetched retrieval candidates with a small CPU cross-encoder.
+
+    All (query, chunk) pairs are scored in one batch. The moving average of the
+    scoring time is compared with `time_budget_ms`: while it is over budget (e.g. the
+    CPU is saturated) re-ranking is skipped and the candidates keep their retrieval
+    order, except for one probe every `probe_every` requests to notice recovery.
+    """
+    def __init__(self, model_name: str = RERANK_MODEL, device: str = DEVICE,
+                 time_budget_ms: float = RERANK_TIME_BUDGET_MS, probe_every: int = RERANK_PROBE_EVERY):
+        self.model_name = model_name
+        self.device = device
+        self.time_budget_ms = time_budget_ms
+        self.probe_every = probe_every
+        self._model = None
+        self._avg_ms = None
+        self._skipped = 0
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                # Imported lazily: the re-ranker is optional and torch is heavy
+                from sentence_transformers import CrossEncoder
+                print(f"Loading cross-encoder re-ranker: {self.model_name}")
+                self._model = CrossEncoder(self.model_name, device=self.device)
+            return self._model
+
+    def _should_rerank(self) -> bool:
+        with self._lock:
+            if self._avg_ms is None or self._avg_ms <= self.time_budget_ms:
+                return True
+            self._skipped += 1
+            if self._skipped >= self.probe_every:
+                self._skipped = 0
+                return True
+            return False
+
+    def _record(self, elapsed_ms: float) -> None:
+        with self._lock:
+            self._avg_ms = elapsed_ms if self._avg_ms is None else 0.8 * self._avg_ms + 0.2 * elapsed_ms
+        metrics.inc("rerank_calls")
+        metrics.inc("rerank_ms_total", elapsed_ms)
+        if elapsed_ms > self.time_budget_ms:
+            metrics.inc("rerank_over_budget")
+
+    def rerank(self, query: str, candidates: List[dict], k: int) -> List[dict]:
+        if len(candidates) <= 1 or not self._should_rerank():
+            if len(candidates) > 1:
+                metrics.inc("rerank_skipped")
+            return candidates[:k]
+
+        model = self._get_model()
+        start = time.perf_counter()
+        scores = model.predict([(query, c["text"]) for c in candidates], batch_size=len(candidates))
+        self._record((time.perf_counter() - start) * 1000)
+
+        ranked = sorted(zip(scores, candidates), key=lambda pair: pair[0], reverse=True)
+        return [{**candidate, "rerank_score": float(score)} for score, candidate in ranked[:k]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"rerank_avg_ms": self._avg_ms or 0.0}
@@ -0,0 +1,174 @@
+from typing import List, Optional, Tuple
+
+from .config import *
+
+# Columns returned for every retrieved chunk, in the order `_to_result` expects
+CHUNK_COLUMNS = "id, content, movie_name, start_time, end_time"
+
+
+def _to_result(row, distance, score=None) -> dict:
+    result = {
+        "id": row[0],
+        "text": row[1],
+        "movie": row[2],
+        "start_time": row[3],
+        "end_time": row[4],
+        "distance": distance,
+    }
+    if score is not None:
+        result["score"] = float(score)
+    return result
+
+
+def _nearest_branch(where: str = "") -> str:
+    """
+    One nearest-neighbour SELECT for VECTOR_STORAGE (params from `_branch_params`).
+    With "binary" the index is walked by hamming distance over 1-bit codes; the short list
+    (RESCORE_CANDIDATES) is then re-ordered by the exact float32 distance if RESCORE_ENABLED.
+    """
+    if VECTOR_STORAGE == "binary":
+        hamming = f"binary_quantize(embedding)::bit({EMBEDDING_DIM}) <~> binary_quantize(%s::vector)"
+        if not RESCORE_ENABLED:
+            return f"""
+                SELECT {CHUNK_COLUMNS}, embedding <-> %s::vector as distance
+                FROM movie_chunks {where}
+                ORDER BY {hamming}
+                LIMIT %s"""
+        return f"""
+            SELECT * FROM (
+                SELECT {CHUNK_COLUMNS}, embedding <-> %s::vector as distance
+                FROM movie_chunks {where}
+                ORDER BY {hamming}
+                LIMIT greatest({RESCORE_CANDIDATES}, %s)) short_list
+            ORDER BY distance
+            LIMIT %s"""
+    cast = "halfvec" if VECTOR_STORAGE == "halfvec" else "vector"
+    return f"""
+        SELECT {CHUNK_COLUMNS}, embedding <-> %s::{cast} as distance
+        FROM movie_chunks {where}
+        ORDER BY distance
+        LIMIT %s"""
+
+
+def _branch_params(query_embedding: List[float], where_params: list, limit: int) -> list:
+    # The binary branch uses the query twice: exact distance (SELECT) and its 1-bit code (ORDER BY)
+    if VECTOR_STORAGE == "binary":
+        limits = [limit, limit] if RESCORE_ENABLED else [limit]
+        return [query_embedding] + where_params + [query_embedding] + limits
+    return [query_embedding] + where_params + [limit]
+
+
+def _vector_candidates(query_embedding: List[float], limit: int,
+                       movies: Optional[List[str]] = None) -> Tuple[str, list]:
+    """
+    SQL (and params) for the `limit` nearest chunks, optionally restricted to `movies`.
+    Filtered searches use one branch per movie so each can use that movie's partial index.
+    """
+    if not movies:
+        return _nearest_branch(), _branch_params(query_embedding, [], limit)
+
+    branch = f"({_nearest_branch('WHERE movie_name = %s')})"
+    params = []
+    for movie in movies:
+        params.extend(_branch_params(query_embedding, [movie], limit))
+    sql = " UNION ALL ".join([branch] * len(movies)) + " ORDER BY distance LIMIT %s"
+    return sql, params + [limit]
+
+
+def vector_search(cur, query_embedding: List[float], k: int,
+                  movies: Optional[List[str]] = None) -> List[dict]:
+    """Pure L2 nearest-neighbour search over movie_chunks."""
+    sql, params = _vector_candidates(query_embedding, k, movies)
+    cur.execute(sql, params)
+    return [_to_result(row, row[5]) for row in cur.fetchall()]
+
+
+def hybrid_search(cur, query_text: str, query_embedding: List[float], k: int,
+                  movies: Optional[List[str]] = None,
+                  candidates: int = HYBRID_CANDIDATES, rrf_k: int = RRF_K) -> List[dict]:
+    """
+    Lexical (full-text) + vector search fused with reciprocal-rank fusion, in one round trip.
+
+    Each side contributes its top `candidates` chunks, and a chunk's score is
+    sum(1 / (rrf_k + rank)) over the lists it appears in. The lexical query ORs the
+    question's terms, so exact names and quotes ("T-X", "Crystal Peak") get a boost
+    even when the embedding misses them.
+    """
+    vector_sql, params = _vector_candidates(query_embedding, candidates, movies)
+    movie_filter = "AND movie_name = ANY(%s)" if movies else ""
+    lexical_params = [TEXT_SEARCH_CONFIG, query_text] + ([movies] if movies else []) + [candidates]
+    cur.execute(
+        f"""
+        WITH vector_hits AS (
+            SELECT id, distance, row_number() OVER (ORDER BY distance) AS rank
+            FROM ({vector_sql}) v
+        ),
+        lexical_query AS (
+            SELECT replace(plainto_tsquery(%s::regconfig, %s)::text, '&', '|')::tsquery AS q
+        ),
+        lexical_hits AS (
+            SELECT id, row_number() OVER (ORDER BY ts_rank_cd(content_tsv, q) DESC) AS rank
+            FROM movie_chunks, lexical_query
+            WHERE q::text <> '' AND content_tsv @@ q {movie_filter}
+            ORDER BY ts_rank_cd(content_tsv, q) DESC
+            LIMIT %s
+        ),
+        fused AS (
+            SELECT coalesce(v.id, l.id) AS id, v.distance,
+                   coalesce(1.0 / (%s + v.rank), 0) + coalesce(1.0 / (%s + l.rank), 0) AS score
+            FROM vector_hits v FULL OUTER JOIN lexical_hits l ON v.id = l.id
+            ORDER BY score DESC
+            LIMIT %s
+        )
+        SELECT {', '.join('c.' + col for col in CHUNK_COLUMNS.split(', '))}, f.distance, f.score
+        FROM fused f JOIN movie_chunks c ON c.id = f.id
+        ORDER BY f.score DESC
+        """,
+        params + lexical_params + [rrf_k, rrf_k, k],
+    )
+    return [_to_result(row, row[5], row[6]) for row in cur.fetchall()]
+
+
+def expand_with_neighbours(cur, results: List[dict], seconds: float = CONTEXT_EXPAND_SECONDS) -> List[dict]:
+    """
+    Replaces each hit's text with the chunks of the same movie that overlap
+    [start - seconds, end + seconds], in time order. This is a b-tree range lookup on
+    (movie_name, start_time), so surrounding dialogue costs no extra vector search.
+    Hits without timestamps (older ingestions) are returned unchanged.
+    """
+    timed = [r for r in results if r.get("start_time") is not None]
+    if seconds <= 0 or not timed:
+        return results
+
+    cur.execute(
+        """
+        SELECT h.ord, c.content, c.start_time, c.end_time
+        FROM unnest(%s::text[], %s::real[], %s::real[]) WITH ORDINALITY AS h(movie, s, e, ord)
+        JOIN movie_chunks c
+          ON c.movie_name = h.movie AND c.start_time < h.e + %s AND c.end_time > h.s - %s
+        ORDER BY h.ord, c.start_time
+        """,
+        (
+            [r["movie"] for r in timed],
+            [r["start_time"] for r in timed],
+            [r["end_time"] for r in timed],
+            seconds, seconds,
+        ),
+    )
+    neighbours = {}
+    for ord_, content, start_time, end_time in cur.fetchall():
+        neighbours.setdefault(ord_ - 1, []).append((content, start_time, end_time))
+    for i, hit in enumerate(timed):
+        if i in neighbours:
+            hit["text"] = " ".join(content for content, _, _ in neighbours[i])
+            hit["start_time"] = min(start for _, start, _ in neighbours[i])
+            hit["end_time"] = max(end for _, _, end in neighbours[i])
+    return results
+
+
+def search_chunks(cur, query_text: str, query_embedding: List[float], k: int,
+                  movies: Optional[List[str]] = None, mode: str = RETRIEVAL_MODE) -> List[dict]:
+    """Runs the retrieval strategy selected by RETRIEVAL_MODE ("vector" or "hybrid")."""
+    if mode == "hybrid":
+        return hybrid_search(cur, query_text, query_embedding, k, movies)
+    return vector_search(cur, query_embedding, k, movies)
@@ -0,0 +1,241 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Sequence, Tuple
+
+from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from psycopg2.extras import Json
+
+from .config import *
+from .metrics import metrics
+
+
+def approx_text_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+def approx_tokens(message: BaseMessage) -> int:
+    return approx_text_tokens(str(message.content))
+
+
+def window_messages(messages: List[BaseMessage], max_messages: int,
+                    max_tokens: int) -> Tuple[List[BaseMessage], int]:
+    """Returns the most recent messages within both caps, and how many old ones were dropped."""
+    tokens = sum(approx_tokens(m) for m in messages)
+    dropped = 0
+    while len(messages) - dropped > 2 and (len(messages) - dropped > max_messages or tokens > max_tokens):
+        tokens -= sum(approx_tokens(m) for m in messages[dropped:dropped + 2])
+        dropped += 2
+    if dropped:
+        metrics.inc("history_messages_trimmed", dropped)
+    return messages[dropped:], dropped
+
+
+class WindowedChatMessageHistory(InMemoryChatMessageHistory):
+    """
+    Chat history that only keeps the most recent messages: at most `max_messages`
+    and roughly `max_tokens`. Old messages are dropped in (question, answer) pairs,
+    so the rephrase prompt stays the same size however long a session runs.
+    """
+    max_messages: int = SESSION_MAX_MESSAGES
+    max_tokens: int = SESSION_MAX_TOKENS
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        super().add_messages(messages)
+        self._trim()
+
+    def _trim(self) -> None:
+        _, dropped = window_messages(self.messages, self.max_messages, self.max_tokens)
+        if dropped:
+            del self.messages[:dropped]
+
+
+class InMemorySessionStore():
+    """
+    Per-process session histories with idle-TTL and LRU eviction.
+
+    Sessions are kept in last-access order, so expired sessions are always at the
+    front and every lookup can evict them in O(expired). Abandoned browser tabs are
+    dropped after `idle_ttl` seconds even if the frontend never calls /delete_History.
+    """
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS, idle_ttl: float = SESSION_IDLE_TTL,
+                 max_messages: int = SESSION_MAX_MESSAGES, max_tokens: int = SESSION_MAX_TOKENS):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self._sessions = OrderedDict()  # session_id -> (history, last_access)
+        self._lock = threading.Lock()
+
+    def _evict_locked(self, now: float) -> None:
+        while self._sessions:
+            session_id, (_, last_access) = next(iter(self._sessions.items()))
+            if now - last_access <= self.idle_ttl and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+            metrics.inc("sessions_evicted")
+
+    def get(self, session_id: str) -> WindowedChatMessageHistory:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            history = entry[0] if entry else WindowedChatMessageHistory(
+                max_messages=self.max_messages, max_tokens=self.max_tokens)
+            self._sessions[session_id] = (history, now)
+            self._evict_locked(now)
+            return history
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            histories = [history for history, _ in self._sessions.values()]
+        messages = [m for history in histories for m in history.messages]
+        return {
+            "sessions": len(histories),
+            "history_messages": len(messages),
+            "history_tokens_approx": sum(approx_tokens(m) for m in messages),
+        }
+
+
+class PostgresChatMessageHistory(BaseChatMessageHistory):
+    """
+    History of one session stored in the `chat_messages` table.
+
+    An instance lives for a single turn: the window of recent messages is read in one
+    round trip on first access (which also refreshes the session's last access), and
+    the turn's new messages are written in one round trip that also trims old rows.
+    """
+    def __init__(self, db_pool, session_id: str, max_messages: int = SESSION_MAX_MESSAGES,
+                 max_tokens: int = SESSION_MAX_TOKENS):
+        self.db_pool = db_pool
+        self.session_id = session_id
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self._messages = None
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        if self._messages is None:
+            self._messages = self._load()
+        return self._messages
+
+    def _load(self) -> List[BaseMessage]:
+        def fetch(cur):
+            cur.execute(
+                """
+                WITH touched AS (
+                    UPDATE chat_sessions SET last_access = now() WHERE session_id = %s)
+                SELECT message FROM (
+                    SELECT id, message FROM chat_messages
+                    WHERE session_id = %s ORDER BY id DESC LIMIT %s) recent
+                ORDER BY id
+                """,
+                (self.session_id, self.session_id, self.max_messages),
+            )
+            return [row[0] for row in cur.fetchall()]
+
+        messages = messages_from_dict(self.db_pool.run(fetch))
+        return window_messages(messages, self.max_messages, self.max_tokens)[0]
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        def write(cur):
+            cur.execute(
+                """
+                INSERT INTO chat_sessions (session_id, last_access) VALUES (%(sid)s, now())
+                ON CONFLICT (session_id) DO UPDATE SET last_access = now();
+
+                INSERT INTO chat_messages (session_id, message)
+                SELECT %(sid)s, m FROM unnest(%(messages)s::jsonb[]) WITH ORDINALITY AS t(m, n)
+                ORDER BY n;
+
+                DELETE FROM chat_messages WHERE session_id = %(sid)s AND id < (
+                    SELECT id FROM chat_messages WHERE session_id = %(sid)s
+                    ORDER BY id DESC OFFSET %(keep)s LIMIT 1);
+                """,
+                {
+                    "sid": self.session_id,
+                    "messages": [Json(message_to_dict(m)) for m in messages],
+                    "keep": self.max_messages - 1,
+                },
+            )
+
+        self.db_pool.run(write)
+        if self._messages is not None:
+            self._messages = window_messages(
+                self._messages + list(messages), self.max_messages, self.max_tokens)[0]
+
+    def clear(self) -> None:
+        self.db_pool.run(lambda cur: cur.execute(
+            "DELETE FROM chat_sessions WHERE session_id = %s", (self.session_id,)))
+        self._messages = []
+
+
+class PostgresSessionStore():
+    """
+    Session histories shared through Postgres, so several uvicorn workers or
+    replicas can serve the same conversation. Idle sessions (and the least recently
+    used beyond `max_sessions`) are swept at most every `sweep_interval` seconds.
+    """
+    def __init__(self, db_pool, max_sessions: int = SESSION_MAX_SESSIONS,
+                 idle_ttl: float = SESSION_IDLE_TTL, max_messages: int = SESSION_MAX_MESSAGES,
+                 max_tokens: int = SESSION_MAX_TOKENS, sweep_interval: float = SESSION_SWEEP_INTERVAL):
+        self.db_pool = db_pool
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+
+    def _sweep(self) -> None:
+        def delete_stale(cur):
+            cur.execute(
+                """
+                DELETE FROM chat_sessions
+                WHERE last_access < now() - make_interval(secs => %s)
+                   OR session_id IN (
+                       SELECT session_id FROM chat_sessions ORDER BY last_access DESC OFFSET %s)
+                """,
+                (self.idle_ttl, self.max_sessions),
+            )
+            return cur.rowcount
+
+        evicted = self.db_pool.run(delete_stale)
+        if evicted:
+            metrics.inc("sessions_evicted", evicted)
+
+    def get(self, session_id: str) -> PostgresChatMessageHistory:
+        now = time.monotonic()
+        with self._lock:
+            due = now - self._last_sweep > self.sweep_interval
+            if due:
+                self._last_sweep = now
+        if due:
+            self._sweep()
+        return PostgresChatMessageHistory(self.db_pool, session_id, self.max_messages, self.max_tokens)
+
+    def delete(self, session_id: str) -> None:
+        PostgresChatMessageHistory(self.db_pool, session_id).clear()
+
+    def stats(self) -> dict:
+        def count(cur):
+            cur.execute("SELECT (SELECT count(*) FROM chat_sessions), (SELECT count(*) FROM chat_messages)")
+            return cur.fetchone()
+
+        sessions, messages = self.db_pool.run(count)
+        return {"sessions": sessions, "history_messages": messages}
+
+
+def make_session_store(backend: str = HISTORY_BACKEND, db_pool=None):
+    """Returns the history backend selected by HISTORY_BACKEND ("memory" or "postgres")."""
+    if backend == "postgres":
+        return PostgresSessionStore(db_pool)
+    if backend == "memory":
+        return InMemorySessionStore()
+    raise ValueError(f"❌ Unknown HISTORY_BACKEND: {backend}")
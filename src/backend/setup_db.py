@@ -1,6 +1,10 @@
 import os
+import re
+import hashlib
+from contextlib import contextmanager
 from dotenv import load_dotenv
 import psycopg2
+from .config import *
 
 
 def get_db_string():
@@ -12,15 +16,235 @@ def get_db_string():
     db = os.environ.get("POSTGRES_DB")
     return f"postgresql://{user}:{pw}@{host}:{port}/{db}"
 
+# pg_advisory_lock keys: serialise schema setup and ingestion across API workers and CLI runs
+SCHEMA_LOCK_KEY = 7_214_001
+INGEST_LOCK_KEY = 7_214_002
+
+@contextmanager
+def advisory_lock(key: int):
+    """
+    Holds a session-level advisory lock on a dedicated connection for the duration of the block.
+    Used for work spanning several transactions (ingestion); closing the connection releases it.
+    """
+    conn = psycopg2.connect(get_db_string())
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute('SELECT pg_try_advisory_lock(%s)', (key,))
+            if not cur.fetchone()[0]:
+                print("ℹ️ Another process holds the lock; waiting for it to finish")
+                cur.execute('SELECT pg_advisory_lock(%s)', (key,))
+        yield
+    finally:
+        conn.close()
+
 def setup_db():
     with psycopg2.connect(get_db_string()) as conn:
         with conn.cursor() as cur:
+            # Workers starting together on a fresh DB would race on CREATE ... IF NOT EXISTS
+            # (duplicate pg_type/relation errors); the lock is released at commit
+            cur.execute('SELECT pg_advisory_xact_lock(%s)', (SCHEMA_LOCK_KEY,))
             cur.execute('CREATE EXTENSION IF NOT EXISTS vector')
-            cur.execute('''
+            if VECTOR_STORAGE != "vector":
+                # halfvec and binary_quantize need pgvector 0.7; picks up a newer extension build
+                cur.execute('ALTER EXTENSION vector UPDATE')
+            cur.execute(f'''
                 CREATE TABLE IF NOT EXISTS movie_chunks (
                     id serial PRIMARY KEY,
                     content text,
-                    embedding vector(384),
+                    embedding {embedding_column_type()},
                     movie_name text)
             ''')
-            conn.commit()
\ No newline at end of file
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS ingest_manifest (
+                    movie_name text PRIMARY KEY,
+                    source_path text,
+                    file_hash text,
+                    chunk_count integer,
+                    status text,
+                    updated_at timestamptz DEFAULT now())
+            ''')
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS answer_cache (
+                    id serial PRIMARY KEY,
+                    movies text[] NOT NULL,
+                    question text,
+                    embedding vector(384),
+                    answer text,
+                    hits integer DEFAULT 0,
+                    created_at timestamptz DEFAULT now(),
+                    last_hit_at timestamptz DEFAULT now())
+            ''')
+            cur.execute('CREATE INDEX IF NOT EXISTS answer_cache_embedding_hnsw ON answer_cache USING hnsw (embedding vector_l2_ops)')
+            cur.execute('CREATE INDEX IF NOT EXISTS answer_cache_last_hit_at ON answer_cache (last_hit_at)')
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS chat_sessions (
+                    session_id text PRIMARY KEY,
+                    last_access timestamptz DEFAULT now())
+            ''')
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS chat_messages (
+                    id bigserial PRIMARY KEY,
+                    session_id text NOT NULL REFERENCES chat_sessions (session_id) ON DELETE CASCADE,
+                    message jsonb NOT NULL)
+            ''')
+            cur.execute('CREATE INDEX IF NOT EXISTS chat_messages_session ON chat_messages (session_id, id)')
+            cur.execute('CREATE INDEX IF NOT EXISTS chat_sessions_last_access ON chat_sessions (last_access)')
+            # Cue timing of each chunk (NULL for chunks ingested before timestamps were kept)
+            cur.execute('ALTER TABLE movie_chunks ADD COLUMN IF NOT EXISTS start_time real')
+            cur.execute('ALTER TABLE movie_chunks ADD COLUMN IF NOT EXISTS end_time real')
+            # Serves both movie filters and time-range lookups of neighbouring chunks
+            cur.execute('DROP INDEX IF EXISTS movie_chunks_movie_name')
+            cur.execute('CREATE INDEX IF NOT EXISTS movie_chunks_movie_time ON movie_chunks (movie_name, start_time)')
+            # Full-text search column for hybrid retrieval (kept in sync by Postgres)
+            cur.execute(f'''
+                ALTER TABLE movie_chunks ADD COLUMN IF NOT EXISTS content_tsv tsvector
+                GENERATED ALWAYS AS (to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(content, ''))) STORED
+            ''')
+            cur.execute('CREATE INDEX IF NOT EXISTS movie_chunks_content_tsv ON movie_chunks USING gin (content_tsv)')
+            # md5 of the chunk text: lets re-ingestion keep unchanged chunks and reuse vectors
+            cur.execute('ALTER TABLE movie_chunks ADD COLUMN IF NOT EXISTS content_hash text')
+            cur.execute('UPDATE movie_chunks SET content_hash = md5(content) WHERE content_hash IS NULL')
+            cur.execute('CREATE INDEX IF NOT EXISTS movie_chunks_content_hash ON movie_chunks (content_hash)')
+            # Databases filled before the manifest existed: register their movies once
+            cur.execute('''
+                INSERT INTO ingest_manifest (movie_name, chunk_count, status)
+                SELECT movie_name, count(*), 'done' FROM movie_chunks
+                WHERE NOT EXISTS (SELECT 1 FROM ingest_manifest)
+                GROUP BY movie_name
+            ''')
+            ensure_embedding_storage(cur)
+            ensure_vector_index(cur)
+            cur.execute("SELECT movie_name FROM ingest_manifest WHERE status = 'done'")
+            for (movie_name,) in cur.fetchall():
+                ensure_movie_index(cur, movie_name)
+            conn.commit()
+
+# Index name suffix per VECTOR_STORAGE ("vector" keeps the original names)
+_STORAGE_SUFFIX = {"vector": "", "halfvec": "_half", "binary": "_bin"}
+
+def embedding_column_type(storage: str = VECTOR_STORAGE) -> str:
+    return f"halfvec({EMBEDDING_DIM})" if storage == "halfvec" else f"vector({EMBEDDING_DIM})"
+
+def embedding_index_expression(storage: str = VECTOR_STORAGE) -> str:
+    """Indexed expression and operator class of the ANN indexes for a storage mode."""
+    if storage == "halfvec":
+        return "embedding halfvec_l2_ops"
+    if storage == "binary":
+        return f"(binary_quantize(embedding)::bit({EMBEDDING_DIM})) bit_hamming_ops"
+    return "embedding vector_l2_ops"
+
+def ensure_embedding_storage(cur, storage: str = VECTOR_STORAGE) -> None:
+    """
+    Converts movie_chunks.embedding to the column type of `storage` (one table rewrite).
+    The indexes on the old type are dropped first; they are recreated by ensure_*_index.
+    """
+    wanted = embedding_column_type(storage)
+    cur.execute(
+        "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+        "WHERE attrelid = 'movie_chunks'::regclass AND attname = 'embedding'"
+    )
+    current = cur.fetchone()[0]
+    if current == wanted:
+        return
+    print(f"ℹ️ Converting movie_chunks.embedding from {current} to {wanted}")
+    cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'movie_chunks' AND indexdef LIKE '%embedding%'")
+    for (index_name,) in cur.fetchall():
+        cur.execute(f'DROP INDEX IF EXISTS {index_name}')
+    cur.execute(f'ALTER TABLE movie_chunks ALTER COLUMN embedding TYPE {wanted} USING embedding::{wanted}')
+
+def vector_index_name(index_type: str = VECTOR_INDEX_TYPE) -> str:
+    """The index name encodes its build parameters, so a config change is detected on startup."""
+    suffix = _STORAGE_SUFFIX[VECTOR_STORAGE]
+    if index_type == "hnsw":
+        return f"movie_chunks_embedding_hnsw_m{HNSW_M}_ef{HNSW_EF_CONSTRUCTION}{suffix}"
+    if index_type == "ivfflat":
+        return f"movie_chunks_embedding_ivfflat_l{IVFFLAT_LISTS}{suffix}"
+    return None
+
+def ensure_vector_index(cur, index_type: str = VECTOR_INDEX_TYPE) -> None:
+    """
+    Creates the ANN index on movie_chunks.embedding and drops any index
+    built with other parameters (or another VECTOR_STORAGE), including per-movie ones
+    (all of them unless `index_type` is "hnsw"). `index_type=None` keeps exact (sequential) search.
+    """
+    wanted = vector_index_name(index_type)
+    cur.execute(
+        "SELECT indexname FROM pg_indexes WHERE tablename = 'movie_chunks' AND indexname LIKE 'movie_chunks_embedding_%'"
+    )
+    for (existing,) in cur.fetchall():
+        if existing != wanted:
+            print(f"ℹ️ Dropping outdated vector index {existing}")
+            cur.execute(f'DROP INDEX IF EXISTS {existing}')
+
+    # Per-movie indexes are recreated by ensure_movie_index; every stale one still costs
+    # a predicate check on each INSERT and plan, so none is kept outside hnsw mode
+    movie_index = re.compile(rf"movie_chunks_movie_[0-9a-f]{{16}}{_movie_index_suffix()}")
+    cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'movie_chunks' AND indexname ~ '^movie_chunks_movie_[0-9a-f]{16}'")
+    for (existing,) in cur.fetchall():
+        if index_type != "hnsw" or not movie_index.fullmatch(existing):
+            print(f"ℹ️ Dropping outdated per-movie index {existing}")
+            cur.execute(f'DROP INDEX IF EXISTS {existing}')
+
+    if index_type == "hnsw":
+        cur.execute(
+            f'CREATE INDEX IF NOT EXISTS {wanted} ON movie_chunks '
+            f'USING hnsw ({embedding_index_expression()}) WITH (m = %s, ef_construction = %s)',
+            (HNSW_M, HNSW_EF_CONSTRUCTION),
+        )
+    elif index_type == "ivfflat":
+        cur.execute(
+            f'CREATE INDEX IF NOT EXISTS {wanted} ON movie_chunks '
+            f'USING ivfflat ({embedding_index_expression()}) WITH (lists = %s)',
+            (IVFFLAT_LISTS,),
+        )
+
+def _movie_index_suffix() -> str:
+    # Build parameters in the name, as in vector_index_name, so a config change is detected
+    return f"_m{HNSW_M}_ef{HNSW_EF_CONSTRUCTION}{_STORAGE_SUFFIX[VECTOR_STORAGE]}"
+
+def movie_index_name(movie_name: str) -> str:
+    # Movie names are free text, so the index is named after a hash of the name
+    digest = hashlib.md5(movie_name.encode('utf-8')).hexdigest()[:16]
+    return f"movie_chunks_movie_{digest}{_movie_index_suffix()}"
+
+def ensure_movie_index(cur, movie_name: str) -> None:
+    """
+    Creates a partial HNSW index over one movie's chunks, so a search restricted to
+    that movie walks a small per-movie graph instead of filtering the global one.
+    Other index types rely on the (movie_name, start_time) b-tree and scan the movie's rows exactly.
+    """
+    if VECTOR_INDEX_TYPE != "hnsw":
+        return
+    cur.execute(
+        f'CREATE INDEX IF NOT EXISTS {movie_index_name(movie_name)} ON movie_chunks '
+        f'USING hnsw ({embedding_index_expression()}) WITH (m = %s, ef_construction = %s) '
+        f'WHERE movie_name = %s',
+        (HNSW_M, HNSW_EF_CONSTRUCTION, movie_name),
+    )
+
+def drop_movie_index(cur, movie_name: str) -> None:
+    cur.execute(f'DROP INDEX IF EXISTS {movie_index_name(movie_name)}')
+
+def rebuild_vector_index() -> None:
+    """
+    IVFFlat centroids are computed from the rows present at build time,
+    so the index has to be rebuilt after bulk loads. HNSW needs no rebuild.
+    """
+    name = vector_index_name()
+    if VECTOR_INDEX_TYPE != "ivfflat" or name is None:
+        return
+    with psycopg2.connect(get_db_string()) as conn:
+        with conn.cursor() as cur:
+            print(f"ℹ️ Rebuilding vector index {name}")
+            cur.execute(f'REINDEX INDEX {name}')
+            conn.commit()
+
+def apply_search_params(cur) -> None:
+    """Sets the query-time recall/latency knobs of the ANN index for this session."""
+    if VECTOR_INDEX_TYPE == "hnsw":
+        # An HNSW scan returns at most ef_search rows, so it must cover the binary short list
+        ef_search = max(HNSW_EF_SEARCH, RESCORE_CANDIDATES) if VECTOR_STORAGE == "binary" else HNSW_EF_SEARCH
+        cur.execute('SET hnsw.ef_search = %s', (ef_search,))
+    elif VECTOR_INDEX_TYPE == "ivfflat":
+        cur.execute('SET ivfflat.probes = %s', (IVFFLAT_PROBES,))
\ No newline at end of file
@@ -0,0 +1,101 @@
+import re
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional
+
+from langchain_core.documents import Document
+
+from .config import *
+
+
+class Cue(NamedTuple):
+    start: float  # seconds
+    end: float    # seconds
+    text: str
+
+
+_TIMING = re.compile(
+    r"(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*-->\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})"
+)
+_BLOCK_SEPARATOR = re.compile(r"\n[ \t]*\n")
+
+
+def _seconds(h: str, m: str, s: str, ms: str) -> float:
+    return int(h) * 3600 + int(m) * 60 + int(s) + int(ms.ljust(3, "0")) / 1000
+
+
+def parse_srt(content: str) -> List[Cue]:
+    """
+    Parses SRT text into cues with start/end times in seconds.
+    A single regex pass per block, no per-line object model, so it is much cheaper
+    than the generic loader. Malformed blocks (no timing line) are skipped.
+    """
+    content = content.lstrip("\ufeff").replace("\r\n", "\n").replace("\r", "\n")
+    cues = []
+    for block in _BLOCK_SEPARATOR.split(content):
+        lines = block.strip().split("\n")
+        for i, line in enumerate(lines[:2]):
+            timing = _TIMING.search(line)
+            if timing:
+                g = timing.groups()
+                text = " ".join(l.strip() for l in lines[i + 1:] if l.strip())
+                if text:
+                    cues.append(Cue(_seconds(*g[:4]), _seconds(*g[4:]), text))
+                break
+    return cues
+
+
+def read_srt(path: str) -> List[Cue]:
+    raw = Path(path).read_bytes()
+    try:
+        content = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        content = raw.decode("latin-1")
+    return parse_srt(content)
+
+
+def chunk_cues(cues: List[Cue], chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+               max_gap: float = SCENE_GAP_SECONDS, max_span: float = CHUNK_MAX_SECONDS,
+               clean: Optional[Callable[[str], str]] = None) -> List[Document]:
+    """
+    Groups consecutive cues into chunks that never cross a dialogue gap longer than
+    `max_gap` seconds (a likely scene change), and stay under `chunk_size` characters
+    and `max_span` seconds. When a chunk is cut for size/span inside a scene, its last
+    cues (up to `chunk_overlap` characters) are repeated at the start of the next one.
+    Every chunk carries `start_time`/`end_time` metadata.
+    """
+    if clean is not None:
+        cues = [Cue(c.start, c.end, clean(c.text)) for c in cues]
+        cues = [c for c in cues if c.text]
+
+    chunks = []
+    current: List[Cue] = []
+    length = 0
+
+    def flush():
+        chunks.append(Document(
+            page_content=" ".join(c.text for c in current),
+            metadata={"start_time": current[0].start, "end_time": current[-1].end},
+        ))
+
+    for cue in cues:
+        if current:
+            scene_break = cue.start - current[-1].end > max_gap
+            too_long = length + 1 + len(cue.text) > chunk_size or cue.end - current[0].start > max_span
+            if scene_break or too_long:
+                flush()
+                carried = []
+                if not scene_break:
+                    carried_len = 0
+                    for previous in reversed(current):
+                        if carried_len + len(previous.text) > chunk_overlap or len(carried) + 1 >= len(current):
+                            break
+                        carried.insert(0, previous)
+                        carried_len += len(previous.text) + 1
+                current = carried
+                length = sum(len(c.text) + 1 for c in current)
+        current.append(cue)
+        length += len(cue.text) + 1
+
+    if current:
+        flush()
+    return chunks
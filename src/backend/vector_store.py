@@ -0,0 +1,216 @@
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+import numpy as np
+
+from .config import *
+from .metrics import metrics
+from .retrieval import search_chunks, expand_with_neighbours
+
+
+class VectorStore(ABC):
+    """
+    Where the retriever finds chunks. `search` returns result dicts shaped like
+    `retrieval._to_result` (id, text, movie, start_time, end_time, distance).
+    """
+    @abstractmethod
+    def search(self, query_text: str, query_embedding: List[float], k: int,
+               movies: Optional[List[str]] = None) -> List[dict]:
+        ...
+
+    def expand(self, results: List[dict], seconds: float = CONTEXT_EXPAND_SECONDS) -> List[dict]:
+        """Widens each hit to the chunks of the same movie within `seconds` of it."""
+        return results
+
+    @abstractmethod
+    def movies(self) -> List[str]:
+        """Movies that can be searched, sorted by name."""
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+    def close(self) -> None:
+        pass
+
+
+class PostgresVectorStore(VectorStore):
+    """pgvector search through the shared connection pool (RETRIEVAL_MODE applies)."""
+    def __init__(self, db_pool):
+        self.db_pool = db_pool
+
+    def search(self, query_text, query_embedding, k, movies=None):
+        return self.db_pool.run(lambda cur: search_chunks(cur, query_text, query_embedding, k, movies))
+
+    def movies(self):
+        def fetch(cur):
+            # The manifest has one row per movie, so this never touches movie_chunks
+            cur.execute("SELECT movie_name FROM ingest_manifest WHERE status = 'done' ORDER BY movie_name")
+            return [row[0] for row in cur.fetchall()]
+
+        return self.db_pool.run(fetch)
+
+    def expand(self, results, seconds=CONTEXT_EXPAND_SECONDS):
+        return self.db_pool.run(lambda cur: expand_with_neighbours(cur, results, seconds))
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Exact L2 search over one contiguous (n_chunks, dim) matrix held in the process.
+
+    Rows are grouped by movie and sorted by start time, so a movie filter is a slice of
+    the matrix and neighbour expansion is a binary search on that slice. Distances come
+    from one matrix product, ||x||^2 - 2 x.q + ||q||^2, with the row norms computed once,
+    and the top k is picked with argpartition instead of a full sort. The matrix may be
+    a read-only memory map (see `from_artifact`), in which case the OS pages it in.
+    """
+    def __init__(self, vectors: np.ndarray, chunks: List[dict]):
+        if len(vectors) != len(chunks):
+            raise ValueError(f"❌ {len(vectors)} vectors for {len(chunks)} chunks")
+        self.vectors = vectors
+        self.chunks = chunks
+        self.sq_norms = np.einsum("ij,ij->i", vectors, vectors, dtype=np.float32)
+        self.starts = np.array([np.nan if c["start_time"] is None else c["start_time"] for c in chunks],
+                               dtype=np.float32)
+        self.slices = {}
+        for row, chunk in enumerate(chunks):
+            first, _ = self.slices.get(chunk["movie"], (row, row))
+            if first != row and chunks[row - 1]["movie"] != chunk["movie"]:
+                raise ValueError(f"❌ Chunks of '{chunk['movie']}' are not contiguous")
+            self.slices[chunk["movie"]] = (first, row + 1)
+        if RETRIEVAL_MODE != "vector":
+            print(f"⚠️ The numpy vector store only does vector search (RETRIEVAL_MODE={RETRIEVAL_MODE} ignored).")
+
+    @classmethod
+    def from_db(cls, db_pool, dtype: str = NUMPY_INDEX_DTYPE) -> "NumpyVectorStore":
+        """Copies every chunk and its vector out of movie_chunks (one query at startup)."""
+        def fetch(cur):
+            cur.execute("""
+                SELECT id, content, movie_name, start_time, end_time, embedding::real[]
+                FROM movie_chunks
+                ORDER BY movie_name, start_time NULLS LAST, id
+            """)
+            return cur.fetchall()
+
+        rows = db_pool.run(fetch)
+        chunks = [
+            {"id": row[0], "text": row[1], "movie": row[2], "start_time": row[3], "end_time": row[4]}
+            for row in rows
+        ]
+        if rows:
+            vectors = np.array([row[5] for row in rows], dtype=dtype).reshape(len(rows), -1)
+        else:
+            # Fresh database: an empty index that simply returns no hits
+            vectors = np.empty((0, EMBEDDING_DIM), dtype=dtype)
+        return cls(vectors, chunks)
+
+    @classmethod
+    def from_artifact(cls, artifact_dir: str = ARTIFACT_DIR) -> "NumpyVectorStore":
+        """
+        Loads an artifact built by `python -m src.backend.ingest build`. The vectors stay
+        memory-mapped unless the artifact shares one vector between repeated chunk texts,
+        in which case they are gathered into one in-memory matrix in chunk order.
+        """
+        from .ingest import open_artifact, iter_artifact_chunks
+
+        _, matrix = open_artifact(artifact_dir)
+        raw = list(iter_artifact_chunks(artifact_dir))
+        # Group by movie (in artifact order) and sort by time, which is how `build` writes them
+        first_row = {}
+        for i, chunk in enumerate(raw):
+            first_row.setdefault(chunk["movie"], i)
+        order = sorted(range(len(raw)), key=lambda i: (first_row[raw[i]["movie"]], raw[i]["start_time"] is None,
+                                                       raw[i]["start_time"] or 0.0, i))
+        chunks = [
+            {"id": i, "text": raw[i]["content"], "movie": raw[i]["movie"],
+             "start_time": raw[i]["start_time"], "end_time": raw[i]["end_time"]}
+            for i in order
+        ]
+        rows = np.array([raw[i]["vector"] for i in order], dtype=np.int64)
+        if len(rows) == len(matrix) and np.array_equal(rows, np.arange(len(rows))):
+            vectors = matrix
+        else:
+            vectors = np.ascontiguousarray(matrix[rows])
+        return cls(vectors, chunks)
+
+    def _ranges(self, movies: Optional[List[str]]) -> List[tuple]:
+        if not movies:
+            return [(0, len(self.chunks))]
+        return [self.slices[movie] for movie in movies if movie in self.slices]
+
+    def search_batch(self, query_embeddings: np.ndarray, k: int,
+                     movies: Optional[List[str]] = None) -> List[List[dict]]:
+        """Top-k for several queries at once: one (n_queries, n_rows) product per movie slice."""
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.vectors.shape[1])
+        q_norms = np.einsum("ij,ij->i", queries, queries)
+        rows, dists = [], []
+        for start, stop in self._ranges(movies):
+            kk = min(k, stop - start)
+            if kk == 0:
+                continue
+            block = self.vectors[start:stop]
+            d2 = self.sq_norms[start:stop][None, :] - 2.0 * (queries @ block.T.astype(np.float32, copy=False))
+            d2 += q_norms[:, None]
+            top = np.argpartition(d2, kk - 1, axis=1)[:, :kk]
+            rows.append(top + start)
+            dists.append(np.take_along_axis(d2, top, axis=1))
+        metrics.inc("numpy_searches", len(queries))
+        if not rows:
+            return [[] for _ in queries]
+
+        rows, dists = np.concatenate(rows, axis=1), np.concatenate(dists, axis=1)
+        order = np.argsort(dists, axis=1)[:, :k]
+        results = []
+        for q_rows, q_dists, q_order in zip(rows, dists, order):
+            results.append([
+                {**self.chunks[q_rows[i]], "distance": float(np.sqrt(max(q_dists[i], 0.0)))}
+                for i in q_order
+            ])
+        return results
+
+    def search(self, query_text, query_embedding, k, movies=None):
+        return self.search_batch(np.asarray(query_embedding, dtype=np.float32)[None, :], k, movies)[0]
+
+    def expand(self, results, seconds=CONTEXT_EXPAND_SECONDS):
+        if seconds <= 0:
+            return results
+        for hit in results:
+            if hit.get("start_time") is None or hit["movie"] not in self.slices:
+                continue
+            start, stop = self.slices[hit["movie"]]
+            # Chunks are at most CHUNK_MAX_SECONDS long, so earlier starts cannot overlap
+            lo = start + np.searchsorted(self.starts[start:stop], hit["start_time"] - seconds - CHUNK_MAX_SECONDS)
+            hi = start + np.searchsorted(self.starts[start:stop], hit["end_time"] + seconds)
+            neighbours = [
+                c for c in self.chunks[lo:hi]
+                if c["start_time"] is not None and c["end_time"] > hit["start_time"] - seconds
+            ]
+            if neighbours:
+                hit["text"] = " ".join(c["text"] for c in neighbours)
+                hit["start_time"] = min(c["start_time"] for c in neighbours)
+                hit["end_time"] = max(c["end_time"] for c in neighbours)
+        return results
+
+    def movies(self):
+        return sorted(self.slices)
+
+    def stats(self):
+        return {
+            "vector_store_rows": len(self.chunks),
+            "vector_store_bytes": int(self.vectors.nbytes),
+            "vector_store_mmap": int(isinstance(self.vectors, np.memmap)),
+        }
+
+
+def make_vector_store(backend: str = VECTOR_BACKEND, db_pool=None) -> VectorStore:
+    """Returns the retrieval backend selected by VECTOR_BACKEND ("postgres" or "numpy")."""
+    if backend == "postgres":
+        return PostgresVectorStore(db_pool)
+    if backend == "numpy":
+        if NUMPY_INDEX_SOURCE == "artifact":
+            store = NumpyVectorStore.from_artifact(ARTIFACT_DIR)
+        else:
+            store = NumpyVectorStore.from_db(db_pool)
+        print(f"✅ Loaded {len(store.chunks)} chunk vectors into the numpy vector store.")
+        return store
+    raise ValueError(f"❌ Unknown VECTOR_BACKEND: {backend}")
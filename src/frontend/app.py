@@ -1,6 +1,6 @@
 import streamlit as st
 import uuid
-from utils import add_to_message_history, answer_question, update_UI_server_status, send_delete_history
+from utils import add_to_message_history, stream_answer, update_UI_server_status, send_delete_history, fetch_movies
 
 
 st.set_page_config(
@@ -20,6 +20,8 @@ if "session_id" not in st.session_state:
 
 with st.sidebar:
     st.info(f"Connected to Session: {st.session_state.session_id[:8]}...", icon="✅")
+    # Leaving the selection empty searches every loaded movie
+    selected_movies = st.multiselect("Movies", fetch_movies(), placeholder="All movies")
 
 st.title("🎬 SubRag 🎬")
 st.header("A RAG system that replies based on the subtiltes of a movie")
@@ -54,9 +56,9 @@ if prompt:= st.chat_input("Ask your question here..."):
 
     if st.session_state.messages[-1]["role"] == "user":
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                response_data = answer_question(prompt, st.session_state.session_id)
-                answer = response_data.get("answer", "❌ Error: No answer key found in API response.")
-                st.markdown(str(answer))
-                add_to_message_history("assistant", str(answer))
+            # Tokens are rendered as soon as the backend streams them
+            answer = st.write_stream(stream_answer(prompt, st.session_state.session_id, selected_movies))
+            if not answer:
+                answer = "❌ Error: The backend returned an empty answer."
+            add_to_message_history("assistant", str(answer))
         st.rerun()
\ No newline at end of file
@@ -3,4 +3,5 @@ import os
 
 
 load_dotenv()
-API_BASE_URL = os.environ.get("BACKEND_URL", "http://127.0.0.1:8000")
\ No newline at end of file
+API_BASE_URL = os.environ.get("BACKEND_URL", "http://127.0.0.1:8000")
+STREAM_READ_TIMEOUT = float(os.environ.get("STREAM_READ_TIMEOUT", 60))  # Max seconds between streamed chunks
@@ -1,6 +1,7 @@
 import streamlit as st
 import requests
-from config import API_BASE_URL
+from config import API_BASE_URL, STREAM_READ_TIMEOUT
+import json
 import time
 
 def add_to_message_history(role: str, content: str) -> None:
@@ -8,24 +9,58 @@ def add_to_message_history(role: str, content: str) -> None:
     message = {"role": role, "content": str(content)}
     st.session_state.messages.append(message)    
 
-def answer_question(question: str, session_id: str) -> dict:
-    """Calls the backend API and returns the response data."""
-    api_endpoint = f"{API_BASE_URL}/api/query"
+def busy_message(response: requests.Response):
+    """Message for a 429/503 overload answer (None for any other response)."""
+    if response.status_code not in (429, 503):
+        return None
+    retry_after = response.headers.get("Retry-After", "a few")
+    return f"⏳ The server is busy right now, please try again in {retry_after} seconds."
+
+def fetch_movies() -> list:
+    """Returns the movies loaded in the backend (empty list if it is unreachable)."""
     try:
-        headers = {"Content-Type": "application/json"}
-        payload = {"query": question, "session_id": session_id}
-        
-        response = requests.post(api_endpoint, json=payload, headers=headers, timeout=15)
-        response.raise_for_status()  # Raises an HTTPError for bad responses (4xx or 5xx)
-        
-        return response.json()
-        
+        response = requests.get(f"{API_BASE_URL}/api/movies", timeout=5)
+        response.raise_for_status()
+        return response.json().get("movies", [])
+    except requests.exceptions.RequestException:
+        return []
+
+def stream_answer(question: str, session_id: str, movies: list = None):
+    """
+    Calls the streaming endpoint and yields the answer chunk by chunk (for `st.write_stream`).
+    The read timeout applies between chunks, so long answers no longer hit a hard limit.
+    """
+    api_endpoint = f"{API_BASE_URL}/api/query/stream"
+    payload = {"query": question, "session_id": session_id, "movies": movies or None}
+    try:
+        with requests.post(api_endpoint, json=payload, stream=True, timeout=(5, STREAM_READ_TIMEOUT)) as response:
+            busy = busy_message(response)
+            if busy:
+                # Not retried automatically: retrying into an overloaded server only adds to the load
+                st.warning(busy)
+                yield busy
+                return
+            response.raise_for_status()
+            event, data = "message", []
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data.append(line[len("data:"):].strip())
+                elif not line and data:
+                    message = json.loads("\n".join(data))
+                    if event == "token":
+                        yield message.get("text", "")
+                    elif event == "error":
+                        yield f"\n\n{message.get('detail', '❌ Error: The answer stream failed.')}"
+                    event, data = "message", []
+
     except requests.exceptions.Timeout:
-        st.error("Request timed out. The backend server took too long to respond.")
-        return {"answer": "❌ Error: The request to the backend timed out."}
+        st.error("Request timed out. The backend server stopped responding.")
+        yield "❌ Error: The request to the backend timed out."
     except requests.exceptions.RequestException as e:
         st.error(f"Could not connect to the backend API: {e}")
-        return {"answer": "❌ Error: Could not retrieve data from the backend."}
+        yield "❌ Error: Could not retrieve data from the backend."
 
 def check_server_status() -> tuple[bool, str]:
     """Fetches the status from the FastAPI health endpoint."""